@@ -0,0 +1,130 @@
+"""
+Compares the shared SQLite cache with Django's LocMemCache.
+
+    python benchmarks/cache_backends.py [--ops 20000] [--workers 4] [--json]
+
+Every backend runs the operations the post card cache issues on a listing
+page (``get_many`` of ten keys, ``set_many`` of misses, ``incr`` of a
+version key) in one process and then in ``--workers`` processes at once.
+With LocMemCache every process only sees its own copy, so the multi-process
+numbers show throughput, not sharing; the ``shared`` column checks whether
+values written by the workers are visible to the parent process.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "sqlite": "yatube.cache_backends.SQLiteCache",
+}
+
+
+def configure(location):
+    settings.configure(
+        CACHES={
+            name: {
+                "BACKEND": backend,
+                "LOCATION": location if name == "sqlite" else name,
+                "OPTIONS": {"MAX_ENTRIES": 1000000},
+            }
+            for name, backend in BACKENDS.items()
+        }
+    )
+    django.setup()
+
+
+def run_ops(name, ops):
+    from django.core.cache import caches
+    cache = caches[name]
+    keys = [f"card:{i}" for i in range(10)]
+    cache.set_many({key: "x" * 2048 for key in keys})
+    cache.add("version", 1, None)
+    timings = {"get_many": 0.0, "set_many": 0.0, "incr": 0.0}
+    for i in range(ops):
+        start = time.perf_counter()
+        cache.get_many(keys)
+        timings["get_many"] += time.perf_counter() - start
+
+        if i % 10 == 0:
+            start = time.perf_counter()
+            cache.set_many({f"miss:{os.getpid()}:{i}": "x" * 2048})
+            timings["set_many"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cache.incr("version")
+            timings["incr"] += time.perf_counter() - start
+    return timings
+
+
+def worker(name, ops, queue):
+    from django.core.cache import caches
+    timings = run_ops(name, ops)
+    caches[name].set(f"written-by:{os.getpid()}", "yes")
+    queue.put((os.getpid(), timings))
+
+
+def bench(name, ops, workers):
+    from django.core.cache import caches
+    caches[name].clear()
+    result = {"backend": name}
+
+    start = time.perf_counter()
+    run_ops(name, ops)
+    result["single_ops_per_sec"] = round(ops / (time.perf_counter() - start))
+
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(name, ops, queue))
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    result["multi_ops_per_sec"] = round(ops * workers / elapsed)
+    result["shared"] = all(
+        caches[name].get(f"written-by:{pid}") == "yes" for pid, _ in outcomes
+    )
+    for op in ("get_many", "set_many", "incr"):
+        total = sum(timings[op] for _, timings in outcomes)
+        calls = ops * workers if op == "get_many" else ops * workers / 10
+        result[f"{op}_us"] = round(total / calls * 1e6, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    multiprocessing.set_start_method("fork")
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "cache.sqlite3"))
+        results = [bench(name, args.ops, args.workers) for name in BACKENDS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = list(results[0])
+    print("  ".join(f"{column:>18}" for column in columns))
+    for result in results:
+        print("  ".join(f"{str(result[column]):>18}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+End-to-end load benchmark of the public pages.
+
+    python benchmarks/load.py [--requests 2000] [--concurrency 1]
+                              [--socket] [--json results.json]
+                              [--compare previous.json]
+                              [--only index,comment] [--sqlite stock]
+
+A throwaway database (and cache) is created in a temporary directory,
+migrated and filled by ``manage.py seed_data``. Then a weighted mix of requests
+(index, group, profile, post, follow feed, commenting, follow/unfollow)
+is sent to the WSGI application of ``yatube/wsgi.py``: called directly in
+this process by default, or through a local HTTP server with
+``--concurrency`` client threads when ``--socket`` is given.
+
+For every view the report shows p50/p95/p99 latency, requests per second
+(``count / summed latency``, i.e. the throughput of one client doing only
+that request), SQL queries per request and response size. ``--json``
+writes the same numbers for comparing runs with ``--compare``.
+
+``--only`` restricts the mix to some of the views. ``--sqlite stock``
+runs without the connection tuning of ``yatube/sqlite_pragmas.py`` and
+without persistent connections, to measure what they bring.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from http.client import HTTPConnection
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (name, weight, needs a logged-in user)
+MIX = [
+    ("index", 30, False),
+    ("group", 10, False),
+    ("profile", 15, False),
+    ("post", 20, False),
+    ("follow", 10, True),
+    ("comment", 5, True),
+    ("follow_toggle", 10, True),
+]
+QUERY_HEADER = "X-Bench-Queries"
+
+_counter = threading.local()
+
+
+def configure(directory, sqlite="tuned"):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = os.path.join(directory, "db.sqlite3")
+    if sqlite == "stock":
+        # What django.db.backends.sqlite3 does on its own.
+        settings.SQLITE_PRAGMAS = {}
+        settings.DATABASES["default"]["CONN_MAX_AGE"] = 0
+    settings.CACHES["default"]["LOCATION"] = os.path.join(
+        directory, "cache.sqlite3"
+    )
+    settings.MEDIA_ROOT = os.path.join(directory, "media")
+    # Debug mode keeps every SQL statement in memory.
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.THUMBNAIL_WORKERS = 0
+    import django
+    django.setup()
+
+
+def count_queries(execute, sql, params, many, context):
+    _counter.queries += 1
+    return execute(sql, params, many, context)
+
+
+def login_sessions(count):
+    """
+    Returns ``(user, cookie header, CSRF token)`` of logged-in sessions,
+    created without going through the login form.
+    """
+    from django.conf import settings
+    from django.contrib.auth import (
+        BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY,
+    )
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.middleware.csrf import _get_new_csrf_token
+
+    from posts.models import User
+
+    sessions = []
+    for user in User.objects.order_by("pk")[:count]:
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        token = _get_new_csrf_token()
+        cookie = (
+            f"{settings.SESSION_COOKIE_NAME}={session.session_key}; "
+            f"{settings.CSRF_COOKIE_NAME}={token}"
+        )
+        sessions.append((user, cookie, token))
+    return sessions
+
+
+class Workload:
+    """
+    Turns the weighted mix into concrete requests against the sample data.
+    """
+
+    def __init__(self, sessions, rng, only=None):
+        from posts.models import Group, Post, User
+        self.rng = rng
+        self.sessions = sessions
+        self.usernames = list(User.objects.values_list("username", flat=True))
+        self.groups = list(Group.objects.values_list("slug", flat=True))
+        self.posts = list(Post.objects.values_list("author__username", "pk"))
+        mix = [entry for entry in MIX if not only or entry[0] in only]
+        self.names = [name for name, _, _ in mix]
+        self.weights = [weight for _, weight, _ in mix]
+        self.needs_login = {name: login for name, _, login in MIX}
+        self.following = defaultdict(bool)
+
+    def next(self):
+        """
+        Returns ``(view, method, path, query, body, cookie, csrf token)``.
+        """
+        rng = self.rng
+        name = rng.choices(self.names, self.weights)[0]
+        session = None
+        if self.needs_login[name] or rng.random() < 0.5:
+            session = rng.choice(self.sessions)
+        user, cookie, token = session or (None, "", "")
+        query, body, method = "", b"", "GET"
+        if name == "index":
+            path = "/"
+            query = rng.choice(["", "", "page=2", "cursor="])
+        elif name == "group":
+            path = f"/group/{rng.choice(self.groups)}"
+        elif name == "profile":
+            path = f"/{rng.choice(self.usernames)}/"
+        elif name == "post":
+            author, pk = rng.choice(self.posts)
+            path = f"/{author}/{pk}/"
+        elif name == "follow":
+            path = "/follow/"
+        elif name == "comment":
+            author, pk = rng.choice(self.posts)
+            path = f"/{author}/{pk}/comment"
+            method = "POST"
+            body = urlencode({"text": "Benchmark comment"}).encode()
+        else:
+            author = rng.choice(self.usernames)
+            key = (user.pk, author)
+            action = "unfollow" if self.following[key] else "follow"
+            self.following[key] = not self.following[key]
+            path = f"/{author}/{action}/"
+        return name, method, path, query, body, cookie, token
+
+
+def measured(app):
+    """
+    WSGI wrapper reporting the number of SQL queries of each request in a
+    response header, so both drivers see it.
+    """
+    from django.db import connections
+
+    def wrapper(environ, start_response):
+        _counter.queries = 0
+        chunks = []
+
+        def capture_start(status, headers, exc_info=None):
+            chunks.append((status, headers))
+            return lambda data: None
+
+        # Wrapped per request rather than per connection: the middleware
+        # pops its own wrappers off the same list, and persistent
+        # connections outlive requests.
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_queries))
+            response = app(environ, capture_start)
+            try:
+                body = b"".join(response)
+            finally:
+                # Sends request_finished, like a real server does.
+                response.close()
+        status, headers = chunks[0]
+        headers = list(headers) + [(QUERY_HEADER, str(_counter.queries))]
+        start_response(status, headers)
+        return [body]
+    return wrapper
+
+
+def call_in_process(app, request):
+    _, method, path, query, body, cookie, token = request
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "wsgi.input": io.BytesIO(body),
+        "CONTENT_LENGTH": str(len(body)),
+        "CONTENT_TYPE": "application/x-www-form-urlencoded",
+    }
+    if cookie:
+        environ["HTTP_COOKIE"] = cookie
+        environ["HTTP_X_CSRFTOKEN"] = token
+    setup_testing_defaults(environ)
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result["status"] = int(status.split()[0])
+        result["headers"] = dict(headers)
+
+    response = app(environ, start_response)
+    try:
+        data = b"".join(response)
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+    return result["status"], len(data), int(result["headers"][QUERY_HEADER])
+
+
+def call_over_socket(port, request):
+    _, method, path, query, body, cookie, token = request
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    if cookie:
+        headers["Cookie"] = cookie
+        headers["X-CSRFToken"] = token
+    connection = HTTPConnection("127.0.0.1", port)
+    try:
+        connection.request(
+            method, path + ("?" + query if query else ""), body, headers
+        )
+        response = connection.getresponse()
+        data = response.read()
+        return (
+            response.status, len(data), int(response.getheader(QUERY_HEADER))
+        )
+    finally:
+        connection.close()
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, elapsed):
+    results = {}
+    for name, rows in sorted(samples.items()):
+        latencies = [row[0] for row in rows]
+        results[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if row[1] >= 400),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "rps": round(len(rows) / sum(latencies), 1),
+            "queries": round(statistics.mean(row[3] for row in rows), 2),
+            "bytes": round(statistics.mean(row[2] for row in rows)),
+        }
+    total = sum(len(rows) for rows in samples.values())
+    results["total"] = {
+        "requests": total,
+        "errors": sum(result["errors"] for result in results.values()),
+        "rps": round(total / elapsed, 1),
+    }
+    return results
+
+
+def run(app, args, workload):
+    samples = defaultdict(list)
+    requests = [workload.next() for _ in range(args.warmup + args.requests)]
+    server = None
+    if args.socket:
+        server = make_server(
+            "127.0.0.1", 0, app,
+            server_class=ThreadingServer, handler_class=QuietHandler,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+        def send(request):
+            return call_over_socket(port, request)
+    else:
+        def send(request):
+            return call_in_process(app, request)
+
+    def timed(request):
+        start = time.perf_counter()
+        status, size, queries = send(request)
+        return request[0], time.perf_counter() - start, status, size, queries
+
+    workers = args.concurrency if args.socket else 1
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(timed, requests[:args.warmup]))
+            start = time.perf_counter()
+            for name, latency, status, size, queries in pool.map(
+                timed, requests[args.warmup:]
+            ):
+                samples[name].append((latency, status, size, queries))
+            elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    return summarize(samples, elapsed)
+
+
+def print_table(results, previous=None):
+    columns = ["requests", "errors", "p50_ms", "p95_ms", "p99_ms", "rps",
+               "queries", "bytes"]
+    width = 18 if previous else 10
+    print(f"{'view':>14}" + "".join(f"{column:>{width}}" for column in columns))
+    for name, result in results.items():
+        cells = []
+        for column in columns:
+            value = result.get(column, "")
+            old = (previous or {}).get(name, {}).get(column)
+            if old and (column.endswith("_ms") or column == "rps"):
+                value = f"{value} ({(value - old) / old * 100:+.0f}%)"
+            cells.append(f"{str(value):>{width}}")
+        print(f"{name:>14}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--socket", action="store_true",
+                        help="Go through a local HTTP server.")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", help="Comma-separated views of MIX to run.")
+    parser.add_argument("--sqlite", choices=["tuned", "stock"],
+                        default="tuned")
+    parser.add_argument("--json", help="Write results to this file.")
+    parser.add_argument("--compare", help="Results of a previous run.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="yatube-bench-")
+    try:
+        configure(directory, args.sqlite)
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0)
+        call_command(
+            "seed_data",
+            users=args.users,
+            posts=args.posts,
+            comments=args.posts * 2,
+            follows=10,
+            seed=args.seed,
+            stdout=io.StringIO(),
+        )
+        only = args.only.split(",") if args.only else None
+        workload = Workload(
+            login_sessions(20), random.Random(args.seed), only
+        )
+
+        from yatube.wsgi import application
+        results = run(measured(application), args, workload)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "mode": "socket" if args.socket else "in-process",
+        "concurrency": args.concurrency if args.socket else 1,
+        "requests": args.requests,
+        "users": args.users,
+        "posts": args.posts,
+        "seed": args.seed,
+        "only": args.only,
+        "sqlite": args.sqlite,
+        "results": results,
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare) as stream:
+            previous = json.load(stream)["results"]
+    print_table(results, previous)
+    if args.json:
+        with open(args.json, "w") as stream:
+            json.dump(report, stream, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Comment
+from .search import filter_matching
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",) 
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идет через полнотекстовый индекс FTS5,
+        # а не через LIKE '%...%' по всей таблице
+        return filter_matching(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 
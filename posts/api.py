@@ -0,0 +1,124 @@
+"""
+Read-only JSON API for the post feeds (mounted under ``/api/v1/``).
+
+Rows are fetched as ``values()`` projections and serialized straight to
+JSON: no model instances, forms or templates are built, and every page is
+a single keyset query without ``COUNT(*)``.
+"""
+from django.conf import settings
+from django.db.models import F
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from .models import Comment, Group, Post, User
+from .paginators import CursorPaginator
+
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+POST_FIELDS = (
+    "id", "text", "pub_date", "image", "comment_count",
+    "author_id", "author__username", "group_id", "group__slug",
+)
+COMMENT_FIELDS = ("id", "text", "created", "author_id", "author__username")
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get("limit", PAGE_SIZE))
+    except ValueError:
+        size = PAGE_SIZE
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def _error(detail, status):
+    return JsonResponse({"detail": detail}, status=status)
+
+
+def serialize_post(row):
+    group = None
+    if row["group_id"] is not None:
+        group = {"id": row["group_id"], "slug": row["group__slug"]}
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "pub_date": row["pub_date"].isoformat(),
+        "image": settings.MEDIA_URL + row["image"] if row["image"] else None,
+        "comment_count": row["comment_count"],
+        "author": {"id": row["author_id"], "username": row["author__username"]},
+        "group": group,
+        "url": reverse("post", args=[row["author__username"], row["id"]]),
+    }
+
+
+def serialize_comment(row):
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "created": row["created"].isoformat(),
+        "author": {"id": row["author_id"], "username": row["author__username"]},
+    }
+
+
+def _page_response(request, rows, serializer, field="pub_date"):
+    paginator = CursorPaginator(rows, _page_size(request), field)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return JsonResponse({
+        "results": [serializer(row) for row in page],
+        "next_cursor": page.next_cursor,
+        "previous_cursor": page.previous_cursor,
+    })
+
+
+def _post_rows(queryset):
+    return queryset.for_feed().values(*POST_FIELDS)
+
+
+@require_GET
+def posts(request):
+    return _page_response(request, _post_rows(Post.objects), serialize_post)
+
+
+@require_GET
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only("pk"), slug=slug)
+    return _page_response(
+        request, _post_rows(Post.objects.filter(group=group)), serialize_post
+    )
+
+
+@require_GET
+def user_posts(request, username):
+    author = get_object_or_404(User.objects.only("pk"), username=username)
+    return _page_response(
+        request, _post_rows(Post.objects.filter(author=author)), serialize_post
+    )
+
+
+@require_GET
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return _error("Authentication required.", 401)
+    rows = Post.objects.filter(
+        timeline_entries__user=request.user
+    ).annotate(
+        feed_date=F("timeline_entries__pub_date")
+    ).for_feed().values(*POST_FIELDS, "feed_date")
+    return _page_response(request, rows, serialize_post, field="feed_date")
+
+
+@require_GET
+def post_detail(request, post_id):
+    row = _post_rows(Post.objects.filter(pk=post_id)).first()
+    if row is None:
+        return _error("Not found.", 404)
+    return JsonResponse(serialize_post(row))
+
+
+@require_GET
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return _error("Not found.", 404)
+    rows = Comment.objects.filter(post_id=post_id).values(*COMMENT_FIELDS)
+    return _page_response(request, rows, serialize_comment, field="created")
@@ -0,0 +1,69 @@
+"""
+Helpers for commands that write posts in bulk (``import_posts``,
+``seed_data``). ``bulk_create`` sends no signals, so these commands call
+``refresh_derived`` to bring counters, timelines and caches up to date.
+"""
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection
+
+from . import freshness, stats, timeline
+from .models import Follow
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def preserve_timestamps(*fields):
+    """
+    Lets ``bulk_create`` keep the given ``auto_now_add`` values instead of
+    stamping every row with the current time.
+    """
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in saved:
+            field.auto_now_add = auto_now_add
+
+
+def reset_sequences(*models):
+    """
+    Moves id sequences past rows inserted with explicit ids (a no-op on
+    SQLite).
+    """
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def refresh_derived(author_ids=None):
+    """
+    Does what the Post/Follow signals would have done row by row: fixes
+    the counters and follow timelines of the given authors (of everybody
+    by default) and makes pages revalidate.
+    """
+    if author_ids is None:
+        stats.reconcile()
+        timeline.rebuild()
+    else:
+        for authors in chunks(sorted(author_ids), 500):
+            stats.reconcile(authors)
+            follows = Follow.objects.filter(
+                author_id__in=authors
+            ).values_list("user_id", "author_id")
+            for user_id, author_id in follows.iterator():
+                timeline.backfill(user_id, author_id)
+    freshness.touch("posts", "users", "groups")
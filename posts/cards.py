@@ -0,0 +1,122 @@
+"""
+Versioned fragment cache for post cards.
+
+Every rendered ``includes/post_item.html`` is cached under a key built from
+the versions of the post, its author and its group. Signals bump those
+versions when any of them (or the post's comments) change, so a stale card
+is never looked up again and everything else keeps hitting the cache.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import freshness
+
+CARD_TEMPLATE = "includes/post_item.html"
+CARD_TIMEOUT = getattr(settings, "POST_CARD_TIMEOUT", 60 * 60 * 24)
+# Cards showing a thumbnail placeholder are bumped once the thumbnail is
+# ready, but not when its generation failed; they expire soon on their
+# own, so the thumbnail is retried once its failure mark is gone.
+PLACEHOLDER_TIMEOUT = getattr(
+    settings, "POST_CARD_PLACEHOLDER_TIMEOUT", 60 * 5
+)
+VERSION_TIMEOUT = None
+
+
+def version_key(kind, pk):
+    return f"card:v:{kind}:{pk}"
+
+
+def _fresh_version():
+    # Never restart from 0 after a version key is evicted, otherwise an old
+    # card cached under that version could become reachable again.
+    return int(time.time() * 1000)
+
+
+def bump(kind, pk):
+    """
+    Invalidates every card that depends on object ``pk`` of ``kind``
+    (``"post"``, ``"user"`` or ``"group"``).
+    """
+    key = version_key(kind, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _fresh_version(), VERSION_TIMEOUT)
+    freshness.touch("posts", f"post:{pk}" if kind == "post" else f"{kind}s")
+
+
+def _versions(posts):
+    keys = set()
+    for post in posts:
+        keys.add(version_key("post", post.pk))
+        keys.add(version_key("user", post.author_id))
+        if post.group_id:
+            keys.add(version_key("group", post.group_id))
+    versions = cache.get_many(keys)
+    missing = {key: _fresh_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            version = cache.get(key, version)
+        versions[key] = version
+    return versions
+
+
+def card_key(post, versions, is_owner):
+    return ":".join(
+        str(part) for part in (
+            "card",
+            post.pk,
+            # pub_date tells apart posts that reuse the id of a deleted one
+            int(post.pub_date.timestamp() * 1000000),
+            versions[version_key("post", post.pk)],
+            versions[version_key("user", post.author_id)],
+            versions.get(version_key("group", post.group_id), 0),
+            int(is_owner),
+        )
+    )
+
+
+def render_cards(posts, user, prepare=None):
+    """
+    Returns the HTML of all cards of ``posts``, rendering only those that
+    are not in the cache yet. Costs two or three cache round trips per page
+    regardless of its size.
+
+    ``prepare`` is called once with the list of posts whose cards have to
+    be rendered, to load whatever they need in bulk.
+    """
+    posts = list(posts)
+    if not posts:
+        return ""
+    versions = _versions(posts)
+    keys = [
+        card_key(
+            post, versions,
+            user.is_authenticated and user.pk == post.author_id
+        )
+        for post in posts
+    ]
+    cards = cache.get_many(keys)
+    misses = [
+        (key, post) for key, post in zip(keys, posts) if key not in cards
+    ]
+    if misses and prepare is not None:
+        prepare([post for _, post in misses])
+    rendered, placeholders = {}, {}
+    for key, post in misses:
+        html = render_to_string(CARD_TEMPLATE, {"post": post, "user": user})
+        if getattr(post, "thumbnail_placeholder", False):
+            placeholders[key] = html
+        else:
+            rendered[key] = html
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+        cards.update(rendered)
+    if placeholders:
+        cache.set_many(placeholders, PLACEHOLDER_TIMEOUT)
+        cards.update(placeholders)
+    return mark_safe("".join(cards[key] for key in keys))
@@ -1,5 +1,9 @@
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
+from django.template.defaultfilters import filesizeformat
 
+from . import images
 from .models import Post, Comment
 
 
@@ -16,6 +20,28 @@ class PostForm(ModelForm):
             "group": "Выберите сообщество, где будет отображен пост."
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файл, обрезанный SizeLimitUploadHandler, не отдаем ImageField:
+        # он бы сообщил о "поврежденном" изображении вместо размера
+        upload = self.files.get('image')
+        self.oversized_image = getattr(upload, 'oversized', False)
+        if self.oversized_image:
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.oversized_image:
+            raise ValidationError(
+                'Файл слишком большой. Максимальный размер: %(limit)s.',
+                code='file_too_large',
+                params={'limit': filesizeformat(images.max_upload_size())},
+            )
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return images.normalize(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
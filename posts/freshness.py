@@ -0,0 +1,120 @@
+"""
+Cheap HTTP validators for the feed and post pages.
+
+Every kind of change that can alter a page touches one or more *scopes*:
+cache keys holding the time (in microseconds) of the last change. A page
+declares the scopes it is built from, and its ``ETag``/``Last-Modified``
+are derived from their newest change time plus the viewer, with a single
+cache round trip and no database query. A revalidation that finds nothing
+changed is answered with ``304 Not Modified`` before the view runs.
+
+Scopes in use:
+
+* ``posts`` - anything shown on a post card (posts, comments, authors,
+  groups, thumbnails);
+* ``post:<id>`` - one post and its comments;
+* ``users`` / ``groups`` - any user (including counters) or group;
+* ``follows:<user id>`` - subscriptions and the follow feed of one user.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+SCOPE_TIMEOUT = None
+
+
+def scope_key(scope):
+    return f"changed:{scope}"
+
+
+def _now():
+    return int(time.time() * 1000000)
+
+
+def _store(scopes):
+    now = _now()
+    cache.set_many({scope_key(scope): now for scope in scopes}, SCOPE_TIMEOUT)
+
+
+def touch(*scopes):
+    """
+    Records that the given scopes changed just now, and once more when the
+    current transaction commits, so a page rendered from the old rows in
+    between is not validated for good.
+    """
+    _store(scopes)
+    transaction.on_commit(lambda: _store(scopes))
+
+
+def changed_at(scopes):
+    """
+    Returns the time of the newest change in ``scopes`` in microseconds.
+    A scope the cache does not know (yet, or any more) counts as changed
+    now, so an eviction can only cost a full response, never a stale one.
+    """
+    keys = [scope_key(scope) for scope in scopes]
+    stamps = cache.get_many(keys)
+    now = _now()
+    for key in keys:
+        if key not in stamps:
+            if not cache.add(key, now, SCOPE_TIMEOUT):
+                stamps[key] = cache.get(key, now)
+            else:
+                stamps[key] = now
+    return max(stamps.values())
+
+
+def conditional_page(get_scopes):
+    """
+    Makes a GET view answer revalidations with ``304 Not Modified``.
+
+    ``get_scopes(request, *args, **kwargs)`` returns the scopes the page is
+    built from. The pages are personalised (navigation, edit links), so the
+    validators include the viewer and responses are ``private`` for
+    logged-in users; ``Vary: Cookie`` keeps shared caches from mixing them.
+    XHR requests get validators of their own, as views may answer them
+    with a fragment instead of the full page.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            stamp = changed_at(get_scopes(request, *args, **kwargs))
+            viewer = request.user.pk if request.user.is_authenticated else 0
+            variant = "xhr" if request.is_ajax() else "page"
+            etag = quote_etag(hashlib.md5(
+                f"{request.get_full_path()}|{viewer}|{variant}|{stamp}"
+                .encode()
+            ).hexdigest())
+            last_modified = stamp // 1000000
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.setdefault("ETag", etag)
+            response.setdefault("Last-Modified", http_date(last_modified))
+            if viewer:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(response, public=True, no_cache=True)
+            patch_vary_headers(response, ("Cookie",))
+            return response
+        return wrapper
+    return decorator
+
+
+def viewer_scopes(request):
+    if request.user.is_authenticated:
+        return [f"follows:{request.user.pk}"]
+    return []
@@ -0,0 +1,67 @@
+"""
+Normalization of uploaded post images.
+
+Camera originals are downscaled to ``POST_IMAGE_MAX_SIDE`` on ingest, turned
+upright according to their EXIF orientation and re-encoded without EXIF,
+so storage and every later thumbnail job only deal with modest images.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+# Formats that are re-encoded; anything else (e.g. animated GIF) is kept.
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 85, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 85},
+}
+CONTENT_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+def max_side():
+    return getattr(settings, "POST_IMAGE_MAX_SIDE", 2048)
+
+
+def max_upload_size():
+    return getattr(settings, "MAX_UPLOAD_SIZE", 10 * 1024 * 1024)
+
+
+def normalize(upload):
+    """
+    Returns a normalized copy of an uploaded image file, or ``upload``
+    itself when its format is not one we re-encode.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image_format = image.format
+        if image_format not in SAVE_OPTIONS:
+            upload.seek(0)
+            return upload
+        limit = (max_side(), max_side())
+        # For JPEG, draft() makes the decoder itself scale down by 1/2..1/8,
+        # so a 20 MB original is never fully decoded in memory.
+        image.draft("RGB", limit)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(limit, Image.LANCZOS)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        name = os.path.splitext(os.path.basename(upload.name))[0]
+        extension = "jpg" if image_format == "JPEG" else image_format.lower()
+        # An anonymous temporary file: the storage copies it in chunks and
+        # the OS removes it once it is closed.
+        output = tempfile.TemporaryFile()
+        # No exif=... argument: the metadata is dropped on purpose.
+        image.save(output, image_format, **SAVE_OPTIONS[image_format])
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, f"{name}.{extension}", CONTENT_TYPES[image_format], size
+    )
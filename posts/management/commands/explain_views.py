@@ -0,0 +1,161 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post
+
+DUMMY_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+}
+# The post form lists every group in its <select>.
+FORM_PLANS = {"SCAN posts_group"}
+# Search results are sorted by BM25 rank, which no index can provide.
+SEARCH_PLANS = {"USE TEMP B-TREE FOR ORDER BY"}
+# The timeline index orders entries by date; only posts published in the
+# same instant are sorted by id, and a feed is capped at TIMELINE_LENGTH.
+TIMELINE_PLANS = {"USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"}
+
+
+class Rollback(Exception):
+    pass
+
+
+def scenarios():
+    """
+    Yields ``(name, url, user, accepted plan lines)`` for every page of
+    ``posts/views.py`` that the sample data in the database allows to
+    build, with a deep page for each listing.
+    """
+    post = Post.objects.select_related("author").order_by("-pk").first()
+    group = Group.objects.order_by("pk").first()
+    follow = Follow.objects.select_related("user").order_by("pk").first()
+    if post is None:
+        return
+    author = post.author
+    yield "index", reverse("index"), None, set()
+    yield "index (page 2)", reverse("index") + "?page=2", None, set()
+    yield "index (cursor)", reverse("index") + "?cursor=", None, set()
+    if group is not None:
+        url = reverse("group_posts", args=[group.slug])
+        yield "group_posts", url, None, set()
+        yield "group_posts (cursor)", url + "?cursor=", None, set()
+    url = reverse("profile", args=[author.username])
+    yield "profile", url, None, set()
+    yield "profile (cursor)", url + "?cursor=", None, set()
+    url = reverse("post", args=[author.username, post.pk])
+    yield "post_view", url, None, set()
+    url = reverse("post_comments", args=[author.username, post.pk])
+    yield "post_comments", url, None, set()
+    url = reverse("search") + "?q=" + post.text.split()[0]
+    yield "search", url, None, SEARCH_PLANS
+    yield "new_post", reverse("new_post"), author, FORM_PLANS
+    url = reverse("post_edit", args=[author.username, post.pk])
+    yield "post_edit", url, author, FORM_PLANS
+    if follow is not None:
+        url = reverse("follow_index")
+        yield "follow_index", url, follow.user, TIMELINE_PLANS
+        yield "follow_index (cursor)", url + "?cursor=", follow.user, (
+            TIMELINE_PLANS
+        )
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_problem(line):
+    """
+    A plan line that reads a whole table without an index or sorts rows in
+    a temporary B-tree. Older SQLite prints ``SCAN TABLE x``, newer just
+    ``SCAN x``.
+    """
+    if "USE TEMP B-TREE" in line:
+        return True
+    return (
+        line.startswith("SCAN ")
+        and "USING" not in line
+        and "VIRTUAL TABLE" not in line
+        and line != "SCAN CONSTANT ROW"
+    )
+
+
+def flagged(plan, accepted=()):
+    return [
+        line for line in plan
+        if is_problem(line) and line not in accepted
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every page of posts/views.py against the current database, "
+        "EXPLAIN each SELECT it runs and flag full table scans and "
+        "temporary B-tree sorts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Print the plans of queries that look fine as well.",
+        )
+        parser.add_argument(
+            "--fail",
+            action="store_true",
+            help="Exit with an error if anything was flagged (for CI).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("explain_views reads SQLite query plans only.")
+        self.problems = 0
+        # Logging in writes a session; nothing of the run is kept.
+        try:
+            with transaction.atomic(), override_settings(
+                CACHES=DUMMY_CACHES, ALLOWED_HOSTS=["testserver"]
+            ):
+                for name, url, user, accepted in list(scenarios()):
+                    self.check_page(name, url, user, accepted, options["all"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if self.problems:
+            message = f"{self.problems} query plan(s) need attention."
+            if options["fail"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS("All query plans use indexes.")
+            )
+
+    def check_page(self, name, url, user, accepted, show_all):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        selects = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].lstrip().upper().startswith("SELECT")
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{name} {url} -> {response.status_code}, "
+            f"{len(selects)} SELECT(s)"
+        ))
+        for sql in selects:
+            plan = explain(sql)
+            bad = flagged(plan, accepted)
+            if not bad and not show_all:
+                continue
+            self.problems += bool(bad)
+            style = self.style.WARNING if bad else (lambda text: text)
+            self.stdout.write(f"  {sql}")
+            for line in plan:
+                marker = "!" if line in bad else " "
+                self.stdout.write(style(f"   {marker} {line}"))
@@ -0,0 +1,181 @@
+import datetime
+import gzip
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts.models import Comment, Follow, Post
+
+CHUNK_SIZE = 2000
+
+# name -> (queryset, date field, projection, row builder). Rows use the
+# format ``import_posts`` reads.
+EXPORTS = {
+    "posts": (
+        Post.objects.all(),
+        "pub_date",
+        ("id", "author__username", "group__slug", "text", "pub_date", "image"),
+        lambda row: {
+            "type": "post",
+            "id": row["id"],
+            "author": row["author__username"],
+            "group": row["group__slug"],
+            "text": row["text"],
+            "pub_date": row["pub_date"].isoformat(),
+            "image": row["image"] or None,
+        },
+    ),
+    "comments": (
+        Comment.objects.all(),
+        "created",
+        ("id", "post_id", "author__username", "text", "created"),
+        lambda row: {
+            "type": "comment",
+            "id": row["id"],
+            "post": row["post_id"],
+            "author": row["author__username"],
+            "text": row["text"],
+            "created": row["created"].isoformat(),
+        },
+    ),
+    "follows": (
+        Follow.objects.all(),
+        None,
+        ("id", "user__username", "author__username"),
+        lambda row: {
+            "type": "follow",
+            "id": row["id"],
+            "user": row["user__username"],
+            "author": row["author__username"],
+        },
+    ),
+}
+
+
+def watermark(name):
+    # "posts" -> "post-id", the option holding the last exported id.
+    return f"{name[:-1]}-id"
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream posts, comments and follows as JSON Lines without loading "
+        "them into memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="Output file (standard output by default).",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output (implied by a .gz file name).",
+        )
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=list(EXPORTS),
+            default=list(EXPORTS),
+            help="Export only these tables.",
+        )
+        parser.add_argument(
+            "--since",
+            help="Only rows published/created after this ISO date(time) "
+                 "(follows have no date and are exported in full).",
+        )
+        for name in EXPORTS:
+            parser.add_argument(
+                f"--since-{watermark(name)}",
+                type=int,
+                help=f"Only {name} with a greater id.",
+            )
+        parser.add_argument(
+            "--since-id",
+            type=int,
+            help="Only rows with a greater id; ids of different tables are "
+                 "unrelated, so this needs a single table in --only.",
+        )
+
+    def open_output(self, path, compress):
+        if path == "-":
+            if compress:
+                return io.TextIOWrapper(
+                    gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"),
+                    encoding="utf-8",
+                )
+            return None
+        if compress or path.endswith(".gz"):
+            return gzip.open(path, "wt", encoding="utf-8")
+        return open(path, "w", encoding="utf-8")
+
+    def since_ids(self, options):
+        since_ids = {
+            name: options[f"since_{watermark(name).replace('-', '_')}"]
+            for name in EXPORTS
+        }
+        if options["since_id"] is not None:
+            if len(options["only"]) != 1:
+                raise CommandError(
+                    "--since-id needs a single table in --only; use "
+                    "--since-post-id, --since-comment-id and "
+                    "--since-follow-id otherwise."
+                )
+            since_ids[options["only"][0]] = options["since_id"]
+        return since_ids
+
+    def handle(self, *args, **options):
+        since_ids = self.since_ids(options)
+        since = options["since"]
+        if since is not None:
+            day = parse_date(since)
+            if day is not None:
+                since = datetime.datetime.combine(day, datetime.time())
+            else:
+                since = parse_datetime(since)
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 date(time).")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        started = time.monotonic()
+        output = self.open_output(options["output"], options["gzip"])
+        if output is None:
+            write = self.stdout.write
+        else:
+            def write(line):
+                output.write(line + "\n")
+
+        summary, resume = [], []
+        try:
+            for name in options["only"]:
+                queryset, date_field, fields, build = EXPORTS[name]
+                last_id = since_ids[name]
+                if last_id is not None:
+                    queryset = queryset.filter(pk__gt=last_id)
+                if since is not None and date_field is not None:
+                    queryset = queryset.filter(**{f"{date_field}__gt": since})
+                rows = queryset.order_by("pk").values(*fields)
+                count = 0
+                for row in rows.iterator(chunk_size=CHUNK_SIZE):
+                    write(json.dumps(build(row), ensure_ascii=False))
+                    count += 1
+                    last_id = row["id"]
+                summary.append(f"{count} {name} (last id {last_id or 0})")
+                resume.append(f"--since-{watermark(name)} {last_id or 0}")
+        finally:
+            if output is not None:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {', '.join(summary)} in "
+            f"{time.monotonic() - started:.1f}s."
+        ))
+        self.stderr.write(f"Next incremental run: {' '.join(resume)}")
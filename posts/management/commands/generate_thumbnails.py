@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Pre-generate card thumbnails for all posts with images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Also retry images that failed recently.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        created = skipped = failed = 0
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        for post in posts.only("pk", "image").iterator():
+            thumbnail_file = thumbnails.card_thumbnail_file(post.image)
+            if default.kvstore.get(thumbnail_file) is not None:
+                skipped += 1
+            elif thumbnails.generate(post.image, options["force"]):
+                created += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created}, already present {skipped}, failed {failed} "
+            f"thumbnail(s) in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,301 @@
+import csv
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import cards, follows
+from posts.bulk import (
+    chunks, preserve_timestamps, refresh_derived, reset_sequences,
+)
+from posts.models import Comment, Group, Post, User
+
+FORMATS = ("jsonl", "csv")
+
+
+class Lookup:
+    """
+    Caches ``natural key -> pk`` of users or groups. Keys missing from the
+    cache are fetched for a whole chunk with one query.
+    """
+
+    def __init__(self, queryset, field, create=None):
+        self.queryset = queryset
+        self.field = field
+        self.create = create
+        self.known = {}
+
+    def resolve(self, keys):
+        missing = {key for key in keys if key and key not in self.known}
+        if not missing:
+            return
+        self.known.update(
+            self.queryset.filter(
+                **{f"{self.field}__in": missing}
+            ).values_list(self.field, "pk")
+        )
+        missing -= set(self.known)
+        if missing and self.create is not None:
+            self.queryset.model.objects.bulk_create(
+                [self.create(key) for key in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            self.known.update(
+                self.queryset.filter(
+                    **{f"{self.field}__in": missing}
+                ).values_list(self.field, "pk")
+            )
+
+    def get(self, key):
+        return self.known.get(key)
+
+
+def _new_user(username):
+    user = User(username=username)
+    user.set_unusable_password()
+    return user
+
+
+def _new_group(slug):
+    return Group(title=slug, slug=slug)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import posts, comments and follows from JSON Lines or CSV. Every row "
+        "is a post (type=post: id, author, group, text, pub_date, image), "
+        "a comment (type=comment: id, post, author, text, created) or a "
+        "subscription (type=follow: user, author). Rows are matched by id, "
+        "so a re-run skips those already imported; rows without an id are "
+        "inserted again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="Input file, or - to read standard input.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Input format (guessed from the file extension by default).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows written per bulk insert and transaction.",
+        )
+        parser.add_argument(
+            "--create-missing",
+            action="store_true",
+            help="Create unknown authors (without a password) and groups "
+                 "instead of skipping their rows.",
+        )
+
+    def read_rows(self, stream, fmt):
+        if fmt == "csv":
+            for row in csv.DictReader(stream):
+                yield {key: value or None for key, value in row.items()}
+            return
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise CommandError(f"Line {number}: {error}")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "csv" if path.endswith(".csv") else "jsonl"
+        create = options["create_missing"]
+        self.users = Lookup(
+            User.objects.all(), "username", _new_user if create else None
+        )
+        self.groups = Lookup(
+            Group.objects.all(), "slug", _new_group if create else None
+        )
+        self.authors = set()
+        self.counts = {
+            "posts": 0, "comments": 0, "follows": 0,
+            "skipped": 0, "existing": 0, "without_id": 0,
+        }
+
+        started = time.monotonic()
+        if path == "-":
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+        else:
+            try:
+                stream = open(path, encoding="utf-8", newline="")
+            except OSError as error:
+                raise CommandError(error)
+        with stream, preserve_timestamps(
+            Post._meta.get_field("pub_date"),
+            Comment._meta.get_field("created"),
+        ):
+            rows = self.read_rows(stream, fmt)
+            for chunk in chunks(rows, options["batch_size"]):
+                self.import_chunk(chunk)
+                if options["verbosity"] > 1:
+                    self.report(started)
+
+        self.finish()
+        self.report(started, style=self.style.SUCCESS)
+        if self.counts["without_id"]:
+            self.stderr.write(self.style.WARNING(
+                f"{self.counts['without_id']} post(s) and comment(s) had no "
+                f"id; importing the file again will duplicate them."
+            ))
+
+    def report(self, started, style=None):
+        elapsed = time.monotonic() - started
+        total = self.counts["posts"] + self.counts["comments"]
+        message = (
+            f"Imported {self.counts['posts']} post(s) and "
+            f"{self.counts['comments']} comment(s), skipped "
+            f"{self.counts['skipped']} invalid and "
+            f"{self.counts['existing']} existing row(s) in {elapsed:.1f}s "
+            f"({total / max(elapsed, 1e-6):.0f} rows/s)."
+        )
+        if self.counts["follows"]:
+            message += f" {self.counts['follows']} new follow(s)."
+        self.stdout.write(style(message) if style else message)
+
+    def parse_id(self, value):
+        try:
+            return int(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    def parse_date(self, value):
+        if not value:
+            return timezone.now()
+        parsed = parse_datetime(value)
+        if parsed is None:
+            return None
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def import_chunk(self, chunk):
+        self.users.resolve(
+            {row.get("author") for row in chunk}
+            | {row.get("user") for row in chunk}
+        )
+        self.groups.resolve({row.get("group") for row in chunk})
+        posts, comments, followed = [], [], {}
+        for row in chunk:
+            kind = row.get("type") or "post"
+            author_id = self.users.get(row.get("author"))
+            if kind == "post":
+                record = self.build_post(row, author_id)
+                target = posts
+            elif kind == "comment":
+                record = self.build_comment(row, author_id)
+                target = comments
+            elif kind == "follow":
+                user_id = self.users.get(row.get("user"))
+                record = author_id if user_id and author_id else None
+                target = record and followed.setdefault(user_id, [])
+            else:
+                record = None
+            if record is None:
+                self.counts["skipped"] += 1
+            else:
+                target.append(record)
+
+        with transaction.atomic():
+            # Existing ids are left alone, so an interrupted import can
+            # simply be run again.
+            posts = self.new_rows(Post, posts)
+            Post.objects.bulk_create(posts, ignore_conflicts=True)
+            if comments:
+                found = set(Post.objects.filter(
+                    pk__in={comment.post_id for comment in comments}
+                ).values_list("pk", flat=True))
+                self.counts["skipped"] += sum(
+                    comment.post_id not in found for comment in comments
+                )
+                comments = self.new_rows(Comment, [
+                    comment for comment in comments
+                    if comment.post_id in found
+                ])
+                Comment.objects.bulk_create(comments, ignore_conflicts=True)
+            # One statement per follower; existing follows are skipped.
+            for user_id, author_ids in followed.items():
+                self.counts["follows"] += follows.follow(
+                    user_id, User.objects.filter(pk__in=author_ids)
+                )
+        self.counts["posts"] += len(posts)
+        self.counts["comments"] += len(comments)
+        self.authors.update(post.author_id for post in posts)
+        # Cards that were cached before the import now show fewer comments.
+        for post_id in {comment.post_id for comment in comments}:
+            cards.bump("post", post_id)
+
+    def new_rows(self, model, rows):
+        """
+        Drops rows whose id is already taken (by the table or an earlier
+        row of the chunk), so that only inserted rows are counted.
+        """
+        ids = {row.pk for row in rows if row.pk is not None}
+        taken = set(
+            model.objects.filter(pk__in=ids).values_list("pk", flat=True)
+        ) if ids else set()
+        new = []
+        for row in rows:
+            if row.pk is None:
+                self.counts["without_id"] += 1
+            elif row.pk in taken:
+                self.counts["existing"] += 1
+                continue
+            else:
+                taken.add(row.pk)
+            new.append(row)
+        return new
+
+    def build_post(self, row, author_id):
+        pub_date = self.parse_date(row.get("pub_date"))
+        group_id = self.groups.get(row.get("group"))
+        if author_id is None or pub_date is None or not row.get("text"):
+            return None
+        if row.get("group") and group_id is None:
+            return None
+        post = Post(
+            id=self.parse_id(row.get("id")),
+            author_id=author_id,
+            group_id=group_id,
+            text=row["text"],
+            pub_date=pub_date,
+            image=row.get("image") or None,
+        )
+        # bulk_create does not call save().
+        post.render_text()
+        return post
+
+    def build_comment(self, row, author_id):
+        created = self.parse_date(row.get("created"))
+        if author_id is None or created is None or not row.get("text"):
+            return None
+        post_id = self.parse_id(row.get("post"))
+        if post_id is None:
+            return None
+        return Comment(
+            id=self.parse_id(row.get("id")),
+            post_id=post_id,
+            author_id=author_id,
+            text=row["text"],
+            created=created,
+        )
+
+    def finish(self):
+        reset_sequences(Post, Comment)
+        refresh_derived(self.authors)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 full-text index over post texts."
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError("Full-text search needs an SQLite database.")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {search.FTS_TABLE} ({search.FTS_TABLE}) "
+                f"VALUES ('rebuild')"
+            )
+            cursor.execute(
+                f"INSERT INTO {search.FTS_TABLE} ({search.FTS_TABLE}) "
+                f"VALUES ('optimize')"
+            )
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized follow timelines from the Follow table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames",
+            nargs="*",
+            help="Only rebuild the timelines of these users.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["usernames"]:
+            user_ids = list(
+                User.objects.filter(
+                    username__in=options["usernames"]
+                ).values_list("pk", flat=True)
+            )
+        rebuilt = timeline.rebuild(user_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {rebuilt} timeline(s).")
+        )
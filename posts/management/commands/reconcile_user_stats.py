@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized post/follower counters of users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames",
+            nargs="*",
+            help="Only reconcile the counters of these users.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["usernames"]:
+            user_ids = list(
+                User.objects.filter(
+                    username__in=options["usernames"]
+                ).values_list("pk", flat=True)
+            )
+        fixed = stats.reconcile(user_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Fixed counters of {fixed} user(s).")
+        )
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import cards
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the rendered HTML body and excerpt of posts that do not have "
+        "them yet (rows written before they existed or by bulk writes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every post, e.g. after the markup rules changed.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        posts = Post.objects.order_by("pk").only(
+            "pk", "text", "text_html", "excerpt"
+        )
+        if not options["all"]:
+            posts = posts.filter(text_html="")
+        checked = updated = 0
+        last = 0
+        # Keyset batches: no read cursor stays open across the updates.
+        while True:
+            chunk = list(posts.filter(pk__gt=last)[:options["batch_size"]])
+            if not chunk:
+                break
+            last = chunk[-1].pk
+            changed = []
+            for post in chunk:
+                rendered = (post.text_html, post.excerpt)
+                post.render_text()
+                if (post.text_html, post.excerpt) != rendered:
+                    changed.append(post)
+            with transaction.atomic():
+                Post.objects.bulk_update(changed, ["text_html", "excerpt"])
+            # Cached cards hold the old markup.
+            for post in changed:
+                cards.bump("post", post.pk)
+            checked += len(chunk)
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {updated} of {checked} post(s) in "
+            f"{time.monotonic() - started:.1f}s."
+        ))
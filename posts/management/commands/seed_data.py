@@ -0,0 +1,253 @@
+import bisect
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from posts.bulk import (
+    chunks, preserve_timestamps, refresh_derived, reset_sequences,
+)
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    "утро вечер город река поезд кофе книга музыка снег солнце дорога "
+    "друг работа отпуск море горы кот собака сад дом окно ветер дождь "
+    "фото прогулка ужин завтрак лес поле небо звезда песня фильм"
+).split()
+
+
+class Zipf:
+    """
+    Draws ``0..size-1`` with probability proportional to
+    ``1 / (rank + 1) ** skew``: a few items get most of the draws.
+    """
+
+    def __init__(self, size, skew, rng):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(
+            1 / (rank + 1) ** skew for rank in range(size)
+        ))
+        self.total = self.cumulative[-1]
+
+    def draw(self):
+        return bisect.bisect(self.cumulative, self.rng.random() * self.total)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic synthetic dataset: users, "
+        "groups, posts, comments and a power-law follow graph."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--comments", type=int, default=30000)
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=20,
+            help="Average number of authors a user follows.",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of author, post and followee popularity "
+                 "(0 means uniform).",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Spread publication dates over this many past days.",
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=0,
+            help="Generate this many distinct images and attach them to "
+                 "posts.",
+        )
+        parser.add_argument(
+            "--image-ratio",
+            type=float,
+            default=0.3,
+            help="Share of posts with an image when --images is given.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="Do not rebuild counters and follow timelines afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 2:
+            raise CommandError("--users must be at least 2.")
+        self.seed = options["seed"]
+        self.rng = random.Random(self.seed)
+        self.batch_size = options["batch_size"]
+        self.started = time.monotonic()
+
+        users = self.create_users(options["users"])
+        groups = self.create_groups(options["groups"])
+        images = self.create_images(options["images"])
+        authors = Zipf(len(users), options["skew"], self.rng)
+        posts = self.create_posts(options, users, groups, images, authors)
+        self.create_comments(options, users, posts)
+        self.create_follows(options, users, authors)
+        reset_sequences(User, Group, Post, Comment, Follow)
+        if not options["skip_derived"]:
+            refresh_derived()
+            self.step("counters and timelines rebuilt")
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded in {time.monotonic() - self.started:.1f}s."
+        ))
+
+    def step(self, message):
+        self.stdout.write(f"[{time.monotonic() - self.started:7.1f}s] {message}")
+
+    def next_ids(self, model, count):
+        start = (model.objects.aggregate(top=Max("pk"))["top"] or 0) + 1
+        return range(start, start + count)
+
+    def insert(self, model, rows):
+        for chunk in chunks(rows, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+
+    def create_users(self, count):
+        ids = self.next_ids(User, count)
+        password = make_password("password")
+        self.insert(User, (
+            User(id=pk, username=f"seed{pk}", password=password)
+            for pk in ids
+        ))
+        self.step(f"{count} users")
+        return ids
+
+    def create_groups(self, count):
+        ids = self.next_ids(Group, count)
+        self.insert(Group, (
+            Group(id=pk, title=f"Сообщество {pk}", slug=f"seed-{pk}",
+                  description=self.text(5, 20))
+            for pk in ids
+        ))
+        self.step(f"{count} groups")
+        return ids
+
+    def create_images(self, count):
+        names = []
+        for index in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            size = (self.rng.randint(400, 1600), self.rng.randint(300, 1200))
+            name = f"posts/seed_{self.seed}_{index}.jpg"
+            # The same seed always draws the same image.
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                Image.new("RGB", size, color).save(buffer, "JPEG", quality=80)
+                name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        if count:
+            self.step(f"{count} images")
+        return names
+
+    def text(self, low, high):
+        return " ".join(
+            self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high))
+        ).capitalize()
+
+    def create_posts(self, options, users, groups, images, authors):
+        count = options["posts"]
+        ids = self.next_ids(Post, count)
+        # Ids grow with the publication date, like in a live database.
+        self.start = timezone.now() - timedelta(days=options["days"])
+        self.step_size = timedelta(days=options["days"]) / max(count, 1)
+
+        def rows():
+            for index, pk in enumerate(ids):
+                image = None
+                if images and self.rng.random() < options["image_ratio"]:
+                    image = self.rng.choice(images)
+                group = None
+                if groups and self.rng.random() < 0.6:
+                    group = groups[self.rng.randrange(len(groups))]
+                post = Post(
+                    id=pk,
+                    text=self.text(5, 80),
+                    author_id=users[authors.draw()],
+                    group_id=group,
+                    image=image,
+                    pub_date=self.start + self.step_size * index,
+                )
+                post.render_text()
+                yield post
+
+        with preserve_timestamps(Post._meta.get_field("pub_date")):
+            self.insert(Post, rows())
+        self.step(f"{count} posts")
+        return ids
+
+    def create_comments(self, options, users, posts):
+        count = options["comments"]
+        if not posts:
+            return
+        # Newer posts draw more comments.
+        popular = Zipf(len(posts), options["skew"], self.rng)
+        now = timezone.now()
+
+        def rows():
+            for _ in range(count):
+                index = len(posts) - 1 - popular.draw()
+                published = self.start + self.step_size * index
+                delay = timedelta(minutes=self.rng.expovariate(1 / 240))
+                yield Comment(
+                    post_id=posts[index],
+                    author_id=users[self.rng.randrange(len(users))],
+                    text=self.text(1, 20),
+                    created=min(published + delay, now),
+                )
+
+        with preserve_timestamps(Comment._meta.get_field("created")):
+            self.insert(Comment, rows())
+        self.step(f"{count} comments")
+
+    def create_follows(self, options, users, authors):
+        average = options["follows"]
+        total = 0
+
+        def rows():
+            nonlocal total
+            for user_id in users:
+                wanted = min(
+                    int(self.rng.expovariate(1 / average)) if average else 0,
+                    len(users) - 1,
+                )
+                followed = set()
+                # Popular authors get most followers; duplicates are
+                # redrawn a bounded number of times.
+                for _ in range(wanted * 3):
+                    if len(followed) == wanted:
+                        break
+                    author_id = users[authors.draw()]
+                    if author_id != user_id:
+                        followed.add(author_id)
+                total += len(followed)
+                for author_id in sorted(followed):
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        self.insert(Follow, rows())
+        self.step(f"{total} follows")
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube import slow_queries
+
+ORDERS = {
+    "total": lambda entry: entry["total"],
+    "max": lambda entry: entry["max"],
+    "count": lambda entry: entry["count"],
+    "mean": lambda entry: entry["total"] / entry["count"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query fingerprints of the slow-query log that cost the "
+        "most, with the views that issued them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--order",
+            choices=sorted(ORDERS),
+            default="total",
+            help="Rank fingerprints by total, max or mean time, or count.",
+        )
+        parser.add_argument(
+            "--view",
+            help="Only count queries issued by this URL name.",
+        )
+        parser.add_argument(
+            "--log",
+            help="Read this log instead of SLOW_QUERY_LOG.",
+        )
+
+    def handle(self, *args, **options):
+        files = slow_queries.log_files(options["log"])
+        if not files:
+            raise CommandError("The slow-query log is empty or missing.")
+        records = slow_queries.read_log(options["log"])
+        if options["view"]:
+            records = (
+                record for record in records
+                if record["view"] == options["view"]
+            )
+        stats = slow_queries.aggregate(records)
+        top = sorted(
+            stats.items(), key=lambda item: ORDERS[options["order"]](item[1]),
+            reverse=True,
+        )[:options["limit"]]
+
+        for digest, entry in top:
+            views = ", ".join(
+                f"{view} x{count}" for view, count in sorted(
+                    entry["views"].items(), key=lambda item: -item[1]
+                )
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{digest}  {entry['count']} call(s), "
+                f"total {entry['total'] * 1000:.1f} ms, "
+                f"mean {entry['total'] / entry['count'] * 1000:.1f} ms, "
+                f"max {entry['max'] * 1000:.1f} ms"
+            ))
+            self.stdout.write(f"  views: {views}")
+            self.stdout.write(f"  {entry['sql']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(stats)} fingerprint(s) in {len(files)} log file(s)."
+        ))
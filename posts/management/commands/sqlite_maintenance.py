@@ -0,0 +1,95 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class Command(BaseCommand):
+    help = (
+        "Routine SQLite upkeep, meant for cron: refresh planner statistics "
+        "(PRAGMA optimize, or a full ANALYZE), return free pages to the OS "
+        "by incremental vacuum and truncate the write-ahead log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            help="Database alias to maintain; repeatable (default: default).",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run a full ANALYZE instead of PRAGMA optimize.",
+        )
+        parser.add_argument(
+            "--vacuum-pages",
+            type=int,
+            default=1000,
+            help="Free pages to release per run; 0 releases all of them.",
+        )
+        parser.add_argument(
+            "--enable-incremental-vacuum",
+            action="store_true",
+            help="Switch an existing database to auto_vacuum=INCREMENTAL "
+                 "(rewrites the whole file with VACUUM once).",
+        )
+
+    def handle(self, *args, **options):
+        for alias in options["database"] or [DEFAULT_DB_ALIAS]:
+            connection = connections[alias]
+            if connection.vendor != "sqlite":
+                raise CommandError(f"{alias} is not an SQLite database.")
+            started = time.monotonic()
+            with connection.cursor() as cursor:
+                self.maintain(cursor, alias, options)
+            self.stdout.write(self.style.SUCCESS(
+                f"{alias}: done in {time.monotonic() - started:.2f}s."
+            ))
+
+    def pragma(self, cursor, statement):
+        cursor.execute(f"PRAGMA {statement}")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def maintain(self, cursor, alias, options):
+        if options["enable_incremental_vacuum"]:
+            self.pragma(cursor, "auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+
+        if options["analyze"]:
+            cursor.execute("ANALYZE")
+            self.stdout.write(f"{alias}: statistics of all indexes rebuilt.")
+        else:
+            # Analyzes only the tables whose statistics are missing or
+            # stale, which is cheap enough to run often.
+            self.pragma(cursor, "optimize")
+            self.stdout.write(f"{alias}: query planner statistics refreshed.")
+
+        free = self.pragma(cursor, "freelist_count")
+        if self.pragma(cursor, "auto_vacuum") == AUTO_VACUUM_INCREMENTAL:
+            pages = options["vacuum_pages"]
+            limit = f"({pages})" if pages else ""
+            # The pragma frees one page per step and returns no rows, so
+            # Cursor.execute would run a single step of it.
+            cursor.connection.executescript(
+                f"PRAGMA incremental_vacuum{limit};"
+            )
+            left = self.pragma(cursor, "freelist_count")
+            self.stdout.write(
+                f"{alias}: released {free - left} of {free} free page(s)."
+            )
+        elif free:
+            self.stdout.write(self.style.WARNING(
+                f"{alias}: {free} free page(s), but auto_vacuum is not "
+                f"INCREMENTAL; run once with --enable-incremental-vacuum."
+            ))
+
+        if self.pragma(cursor, "journal_mode") == "wal":
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            _, log, checkpointed = cursor.fetchone()
+            self.stdout.write(
+                f"{alias}: checkpointed {checkpointed} of {log} WAL frame(s)."
+            )
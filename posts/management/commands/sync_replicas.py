@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_database(alias):
+    """
+    Overwrites the SQLite database ``alias`` with a consistent snapshot of
+    the primary through SQLite's online backup API; readers of the replica
+    see either the old or the new copy.
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    target = connections[alias]
+    if source.vendor != "sqlite" or target.vendor != "sqlite":
+        raise CommandError(
+            f"sync_replicas copies SQLite databases only; replicate {alias} "
+            f"with the tools of its database server."
+        )
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto its read replicas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "aliases",
+            nargs="*",
+            help="Replicas to refresh (default: DATABASE_REPLICAS).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep refreshing every this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError(
+                "No replicas: list them in DATABASE_REPLICAS or pass them "
+                "as arguments."
+            )
+        for alias in aliases:
+            if alias == DEFAULT_DB_ALIAS or alias not in settings.DATABASES:
+                raise CommandError(f"{alias} is not a replica database.")
+        while True:
+            started = time.monotonic()
+            for alias in aliases:
+                copy_database(alias)
+            self.stdout.write(self.style.SUCCESS(
+                f"Copied the primary onto {', '.join(aliases)} in "
+                f"{time.monotonic() - started:.2f}s."
+            ))
+            if options["interval"] is None:
+                break
+            time.sleep(options["interval"])
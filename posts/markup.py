@@ -0,0 +1,38 @@
+"""
+Post bodies rendered at write time.
+
+``Post.save()`` stores the escaped HTML of the text (what ``linebreaksbr``
+used to produce on every render) and, for long posts, a shorter excerpt
+for listings, so templates output stored markup as is. Writes that bypass
+``save()`` (``bulk_create``, ``QuerySet.update``) call ``Post.render_text``
+themselves or are repaired by ``manage.py render_posts``.
+"""
+import re
+
+from django.template.defaultfilters import linebreaksbr
+
+# Listings show at most this many characters and lines of a post.
+EXCERPT_LENGTH = 500
+EXCERPT_LINES = 8
+PARTIAL_WORD = re.compile(r"\S*$")
+
+
+def render_html(text):
+    return linebreaksbr(text, autoescape=True)
+
+
+def render_excerpt(text):
+    """
+    Returns the HTML of the beginning of ``text``, cut at a word boundary
+    and ended with an ellipsis, or ``""`` if the text is short enough to
+    be listed whole.
+    """
+    lines = text.splitlines()
+    short = "\n".join(lines[:EXCERPT_LINES])
+    if len(lines) <= EXCERPT_LINES and len(short) <= EXCERPT_LENGTH:
+        return ""
+    if len(short) > EXCERPT_LENGTH:
+        # Drop the word the limit falls into, unless it is the only one.
+        cut = PARTIAL_WORD.sub("", short[:EXCERPT_LENGTH + 1])
+        short = cut if cut.strip() else short[:EXCERPT_LENGTH]
+    return render_html(short.rstrip() + "…")
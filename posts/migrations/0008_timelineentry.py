@@ -0,0 +1,72 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """
+    Fills the inboxes of existing followers with one INSERT ... SELECT per
+    follower, like ``posts.timeline.rebuild``.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    length = getattr(settings, 'TIMELINE_LENGTH', 1000)
+    columns = ', '.join(
+        quote(TimelineEntry._meta.get_field(name).column)
+        for name in ('user', 'post', 'pub_date')
+    )
+    followers = Follow.objects.order_by('user_id').values_list(
+        'user_id', flat=True
+    ).distinct()
+    with connection.cursor() as cursor:
+        for user_id in list(followers):
+            newest = Post.objects.filter(
+                author__following__user_id=user_id
+            ).order_by('-pub_date').values_list('pk', 'pub_date')[:length]
+            sql, params = newest.query.sql_with_params()
+            cursor.execute(
+                f'INSERT INTO {quote(TimelineEntry._meta.db_table)} '
+                f'({columns}) SELECT %s, newest.* FROM ({sql}) newest',
+                (user_id, *params),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_auto_20200708_2122'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date'], name='timeline_feed_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.template.defaultfilters import truncatechars
 
+from . import markup
+
 User = get_user_model()
 
 
@@ -14,6 +18,41 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """
+        Everything a post card renders, in one query: author and group are
+        joined in, and the number of comments is counted by a correlated
+        subquery so that only the rows of the current page are counted.
+        """
+        comment_count = Comment.objects.filter(
+            post=OuterRef("pk")
+        ).order_by().values("post").annotate(count=Count("pk")).values("count")
+        return self.select_related("author", "group").annotate(
+            comment_count=Coalesce(
+                Subquery(comment_count, output_field=IntegerField()), 0
+            )
+        )
+
+    def count(self):
+        # Per-row annotations such as the comment counter do not change the
+        # number of rows, but left in place they turn COUNT(*) into a
+        # subquery that computes them for every post (the Paginator counts
+        # whole listings). Joins they added stay in the query.
+        extra = [
+            name for name, annotation in self.query.annotations.items()
+            if not annotation.contains_aggregate
+        ]
+        if self._result_cache is not None or not extra:
+            return super().count()
+        clone = self.order_by()
+        for name in extra:
+            del clone.query.annotations[name]
+            if clone.query.annotation_select_mask is not None:
+                clone.query.annotation_select_mask.discard(name)
+        return super(PostQuerySet, clone).count()
+
+
 class Post(models.Model):
     text = models.TextField("Текст")
     pub_date = models.DateTimeField(
@@ -36,13 +75,32 @@ class Post(models.Model):
     )
     # поле для картинки
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    # текст, уже экранированный и размеченный для шаблонов (posts/markup.py)
+    text_html = models.TextField(editable=False, blank=True, default="")
+    excerpt = models.TextField(editable=False, blank=True, default="")
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        # Ascending on purpose: SQLite walks them backwards for
+        # ORDER BY pub_date DESC, id DESC without a sort step.
+        indexes = [
+            models.Index(fields=['author', 'pub_date'], name='post_author_feed_idx'),
+            models.Index(fields=['group', 'pub_date'], name='post_group_feed_idx'),
+        ]
 
     def __str__(self):
         return f"Text:{truncatechars(self.text, 20)}"
 
+    def render_text(self):
+        self.text_html = markup.render_html(self.text)
+        self.excerpt = markup.render_excerpt(self.text)
+
+    def save(self, *args, **kwargs):
+        self.render_text()
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -63,6 +121,9 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', 'created'], name='comment_post_idx'),
+        ]
     
     def __str__(self):
         return f"Text:{truncatechars(self.text, 10)}"
@@ -80,4 +141,53 @@ class Follow(models.Model):
         related_name="following"
     )
     class Meta:
-        unique_together = ['user', 'author']
\ No newline at end of file
+        unique_together = ['user', 'author']
+        # Followers of an author, without touching the table rows.
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_idx'),
+        ]
+
+class TimelineEntry(models.Model):
+    """
+    Materialized follow feed: one row per post delivered to a follower.
+
+    ``pub_date`` is copied from the post so the feed of a user is a single
+    range scan over the ``(user, -pub_date)`` index.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date',)
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date'], name='timeline_feed_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Denormalized counters shown on the author card. Kept up to date by
+    signals in ``posts.stats``; ``reconcile_user_stats`` repairs drift.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField("Записей", default=0)
+    followers_count = models.PositiveIntegerField("Подписчиков", default=0)
+    following_count = models.PositiveIntegerField("Подписан", default=0)
+
+    def __str__(self):
+        return f"Stats:{self.user_id}"
@@ -0,0 +1,133 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def _value(obj, name):
+    # Rows may be model instances or dicts from a values() projection.
+    if isinstance(obj, dict):
+        return obj[name] if name != "pk" else obj.get("pk", obj.get("id"))
+    return getattr(obj, name)
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated listing.
+
+    Quacks like ``django.core.paginator.Page`` for the parts the templates
+    use (iteration, ``len``, ``has_next``/``has_previous``), but instead of
+    page numbers it exposes opaque ``next_cursor``/``previous_cursor``
+    tokens.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator ordered by ``(<field> DESC, id DESC)``.
+
+    Every page is fetched with a single ``LIMIT`` query that seeks to the
+    cursor position through the index on ``field``, so there is neither
+    ``COUNT(*)`` nor ``OFFSET`` and deep pages cost the same as the first
+    one.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, field="pub_date"):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.field = field
+
+    def encode_cursor(self, direction, obj):
+        value = _value(obj, self.field).isoformat()
+        raw = f"{direction}|{value}|{_value(obj, 'pk')}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """
+        Returns ``(direction, value, pk)`` or ``None`` for a missing or
+        malformed cursor, which is then treated as the first page.
+        """
+        if not cursor:
+            return None
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            direction, value, pk = raw.split("|")
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            return None
+        if direction not in ("next", "prev") or value is None:
+            return None
+        return direction, value, pk
+
+    def get_page(self, cursor):
+        field = self.field
+        position = self.decode_cursor(cursor)
+        queryset = self.object_list
+        limit = self.per_page + 1
+
+        if position is None:
+            direction = None
+            rows = list(queryset.order_by(f"-{field}", "-pk")[:limit])
+        else:
+            direction, value, pk = position
+            if direction == "next":
+                seek = Q(**{f"{field}__lt": value}) | Q(
+                    **{field: value, "pk__lt": pk}
+                )
+                rows = list(
+                    queryset.filter(seek).order_by(f"-{field}", "-pk")[:limit]
+                )
+            else:
+                seek = Q(**{f"{field}__gt": value}) | Q(
+                    **{field: value, "pk__gt": pk}
+                )
+                rows = list(
+                    queryset.filter(seek).order_by(field, "pk")[:limit]
+                )
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == "prev":
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, direction == "next"
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor("next", rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor("prev", rows[0])
+        return CursorPage(rows, self, next_cursor, previous_cursor)
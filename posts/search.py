@@ -0,0 +1,108 @@
+"""
+Full-text search over posts backed by the ``posts_post_fts`` FTS5 table
+(see migration ``0010_post_search``).
+"""
+import base64
+import binascii
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .paginators import CursorPage
+
+FTS_TABLE = "posts_post_fts"
+
+
+def fts_query(text):
+    """
+    Turns free user input into an FTS5 query: every word is quoted, so
+    operators and stray quotes can't break the MATCH syntax, and the words
+    are ANDed together. Returns an empty string if there is nothing to find.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    return " ".join(f'"{word}"' for word in words if word)
+
+
+def available():
+    return connection.vendor == "sqlite"
+
+
+def filter_matching(queryset, text):
+    """
+    Restricts a Post queryset to posts matching ``text`` (used by the
+    admin, which keeps its own ordering).
+    """
+    query = fts_query(text)
+    if not query:
+        return queryset
+    if not available():
+        return queryset.filter(text__icontains=text)
+    return queryset.filter(pk__in=RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        [query],
+    ))
+
+
+def encode_cursor(rank, pk):
+    raw = f"{rank!r}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, pk = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return float(rank), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def search(text, cursor=None, per_page=10):
+    """
+    Returns a ``CursorPage`` of posts matching ``text``, best matches
+    first (BM25), paginated by a ``(rank, id)`` keyset cursor.
+    """
+    query = fts_query(text)
+    if not query:
+        return CursorPage([], None, None, None)
+    if not available():
+        posts = list(
+            Post.objects.for_feed().filter(text__icontains=text)[:per_page]
+        )
+        return CursorPage(posts, None, None, None)
+
+    sql = (
+        f"SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s"
+    )
+    params = [query]
+    position = decode_cursor(cursor)
+    if position is not None:
+        sql = (
+            f"SELECT rowid, score FROM ({sql}) "
+            f"WHERE score > %s OR (score = %s AND rowid > %s)"
+        )
+        params += [position[0], position[0], position[1]]
+    sql += " ORDER BY score, rowid LIMIT %s"
+    params.append(per_page + 1)
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        hits = db.fetchall()
+
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+    found = Post.objects.for_feed().in_bulk([pk for pk, _ in hits])
+    posts = []
+    for pk, score in hits:
+        if pk in found:
+            post = found[pk]
+            post.search_rank = score
+            posts.append(post)
+    next_cursor = None
+    if has_next and hits:
+        next_cursor = encode_cursor(hits[-1][1], hits[-1][0])
+    return CursorPage(posts, None, next_cursor, None)
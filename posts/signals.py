@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cards, follows, stats, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_card(sender, instance, **kwargs):
+    cards.bump("post", instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_card(sender, instance, **kwargs):
+    cards.bump("post", instance.post_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_cards(sender, instance, created, update_fields=None,
+                            **kwargs):
+    # Logging in only touches last_login, which no card shows.
+    if not created and update_fields != frozenset({"last_login"}):
+        cards.bump("user", instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_cards(sender, instance, **kwargs):
+    cards.bump("group", instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def deliver_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        with transaction.atomic():
+            stats.change(instance.author_id, "posts_count", 1)
+            timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def forget_post(sender, instance, **kwargs):
+    stats.change(instance.author_id, "posts_count", -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follows.followed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    follows.unfollowed(instance.user_id, [instance.author_id])
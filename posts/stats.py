@@ -0,0 +1,93 @@
+"""
+Denormalized per-user counters for the author card.
+
+Counters are moved with single ``UPDATE ... SET x = x + 1`` statements
+right after the Post/Follow row is written, inside the caller's
+transaction, so concurrent writers never lose increments. ``reconcile``
+recomputes them from the source tables in bulk.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import bulk, freshness
+from .models import Follow, Post, User, UserStats
+
+COUNTERS = ("posts_count", "followers_count", "following_count")
+BATCH_SIZE = 500
+
+
+def get_stats(user):
+    """
+    Returns the counters of ``user``, repairing a missing row on the fly.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        reconcile([user.pk])
+        return UserStats.objects.get(pk=user.pk)
+
+
+def change(user_id, field, delta):
+    # A missing row is left alone: get_stats() rebuilds it on first read.
+    # Counters that drifted low stop at zero instead of violating the
+    # CHECK of the positive field; reconcile() repairs them.
+    UserStats.objects.filter(pk=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+    freshness.touch("users")
+
+
+def _count(model, field):
+    counts = model.objects.filter(
+        **{field: OuterRef("pk")}
+    ).order_by().values(field).annotate(total=Count("pk")).values("total")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile(user_ids=None):
+    """
+    Recomputes the counters of the given users (of everybody by default)
+    and writes only rows that drifted. Returns the number of rows fixed.
+    """
+    users = User.objects.order_by("pk").annotate(
+        posts_total=_count(Post, "author"),
+        followers_total=_count(Follow, "author"),
+        following_total=_count(Follow, "user"),
+    )
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    rows = users.values_list(
+        "pk", "posts_total", "followers_total", "following_total"
+    )
+
+    return sum(
+        _apply(batch) for batch in bulk.chunks(rows.iterator(), BATCH_SIZE)
+    )
+
+
+def _apply(rows):
+    actual = {
+        pk: UserStats(
+            user_id=pk,
+            posts_count=posts,
+            followers_count=followers,
+            following_count=following,
+        )
+        for pk, posts, followers, following in rows
+    }
+    stored = UserStats.objects.in_bulk(list(actual))
+    missing = [stats for pk, stats in actual.items() if pk not in stored]
+    drifted = [
+        stats for pk, stats in actual.items()
+        if pk in stored and any(
+            getattr(stored[pk], name) != getattr(stats, name)
+            for name in COUNTERS
+        )
+    ]
+    with transaction.atomic():
+        UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+        UserStats.objects.bulk_update(drifted, COUNTERS)
+    if missing or drifted:
+        freshness.touch("users")
+    return len(missing) + len(drifted)
@@ -0,0 +1,97 @@
+"""
+Streaming page rendering, switched on by the ``STREAMING_PAGES`` setting.
+
+``render`` renders the page template right away but leaves out the heavy
+sections: the post cards of ``{% post_cards %}`` and whatever is wrapped
+in ``{% streamed %}...{% endstreamed %}`` (``posts/templatetags/streaming.py``)
+are replaced by markers. The response is a ``StreamingHttpResponse`` whose
+first chunk is everything before the first marker (the ``<head>``, the
+navigation, the author card), so the browser starts fetching styles and
+laying out the page while the sections are rendered and sent one after
+another.
+
+Deferred sections run after the middleware has processed the response,
+so they must not need anything the middleware finalizes: no
+``{% csrf_token %}``, no messages. Their queries and render time are not
+part of ``Server-Timing``.
+"""
+import logging
+import re
+import uuid
+from copy import copy
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import render as render_now
+from django.template import loader
+
+logger = logging.getLogger(__name__)
+
+# Post cards are sent in groups of this many.
+CARD_CHUNK = 5
+
+
+class Stream:
+    """
+    Collects the sections a template defers while it is rendered.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.sections = []
+        # Sections render their own nested sections inline.
+        self.flushing = False
+        self.pattern = re.compile(f"<!--stream:{self.token}:(\\d+)-->")
+
+    def defer(self, render):
+        """
+        Registers ``render``, a callable returning an iterable of HTML
+        chunks, and returns the marker to output in its place.
+        """
+        self.sections.append(render)
+        return f"<!--stream:{self.token}:{len(self.sections) - 1}-->"
+
+    def defer_nodelist(self, nodelist, context):
+        # The context stack changes as rendering goes on; keep it as it is
+        # at the tag.
+        context = copy(context)
+        return self.defer(lambda: [nodelist.render(context)])
+
+    def chunks(self, page):
+        parts = self.pattern.split(page)
+        yield parts[0]
+        self.flushing = True
+        for index, text in zip(parts[1::2], parts[2::2]):
+            try:
+                yield from self.sections[int(index)]()
+            except Exception:
+                # The status line is long gone; end the page cleanly.
+                logger.exception("Cannot render a streamed section")
+            yield text
+
+
+def current(context):
+    """
+    Returns the ``Stream`` a template is rendered into, or ``None`` when the
+    section has to be rendered inline.
+    """
+    stream = context.get("stream")
+    if isinstance(stream, Stream) and not stream.flushing:
+        return stream
+    return None
+
+
+def render(request, template_name, context=None, status=None):
+    """
+    ``django.shortcuts.render`` that streams the page when
+    ``STREAMING_PAGES`` is on.
+    """
+    if not getattr(settings, "STREAMING_PAGES", False):
+        return render_now(request, template_name, context, status=status)
+    stream = Stream()
+    template = loader.get_template(template_name)
+    page = template.render(dict(context or {}, stream=stream), request)
+    response = StreamingHttpResponse(stream.chunks(page), status=status)
+    # Proxies such as nginx would otherwise buffer the whole page.
+    response["X-Accel-Buffering"] = "no"
+    return response
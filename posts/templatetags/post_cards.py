@@ -0,0 +1,26 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import streaming
+from posts.bulk import chunks
+from posts.cards import render_cards
+from posts.thumbnails import prefetch
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """
+    Renders the cards of a page of posts from the versioned fragment cache;
+    thumbnails of the cards that miss it are looked up in one batch. A
+    streamed page gets the cards later, a few at a time.
+    """
+    user = context["user"]
+    stream = streaming.current(context)
+    if stream is None:
+        return render_cards(posts, user, prepare=prefetch)
+    return mark_safe(stream.defer(lambda: (
+        render_cards(chunk, user, prepare=prefetch)
+        for chunk in chunks(posts, streaming.CARD_CHUNK)
+    )))
@@ -0,0 +1,18 @@
+from django import template
+
+from posts import thumbnails
+from yatube import metrics
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_thumbnail(post):
+    """
+    Returns the ready card thumbnail of the post or ``None`` while it is
+    being generated in the background:
+
+        {% card_thumbnail post as im %}
+    """
+    with metrics.timed("thumbnail"):
+        return thumbnails.lookup(post)
@@ -0,0 +1,31 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import streaming
+
+register = template.Library()
+
+
+class StreamedNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        stream = streaming.current(context)
+        if stream is None:
+            return self.nodelist.render(context)
+        return mark_safe(stream.defer_nodelist(self.nodelist, context))
+
+
+@register.tag
+def streamed(parser, token):
+    """
+    Marks a heavy part of a page that is sent after the rest of it when the
+    page is streamed (see ``posts/streaming.py``); rendered in place
+    otherwise:
+
+        {% streamed %}...{% endstreamed %}
+    """
+    nodelist = parser.parse(("endstreamed",))
+    parser.delete_first_token()
+    return StreamedNode(nodelist)
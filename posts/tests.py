@@ -1,10 +1,32 @@
+import gzip
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.core.cache import cache
-from django.test import TestCase, Client, override_settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.template.loader import render_to_string
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default as sorl_default
+
+from yatube import metrics, slow_queries
+from yatube.cache_backends import SQLiteCache
 
-from .models import Post, Group, Comment, Follow
+from . import cards, follows, search, thumbnails, timeline
+from .models import Post, Group, Comment, Follow, TimelineEntry, UserStats
 
 
 DUMMY_CACHES = {
@@ -13,9 +35,27 @@ DUMMY_CACHES = {
     }
 }
 
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'conditional-get-tests',
+    }
+}
+
+# Тесты не должны трогать (и чистить) кэш проекта в BASE_DIR/cache
+TEST_CACHE_DIR = tempfile.TemporaryDirectory()
+
+SQLITE_CACHES = {
+    'default': {
+        'BACKEND': 'yatube.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(TEST_CACHE_DIR.name, 'default.sqlite3'),
+    }
+}
+
 User = get_user_model()
 
 
+@override_settings(CACHES=SQLITE_CACHES)
 class UserNotAuthorizedTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -41,6 +81,7 @@ class UserNotAuthorizedTests(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+@override_settings(CACHES=SQLITE_CACHES, THUMBNAIL_WORKERS=0)
 class UserIsAuthorizedTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -262,8 +303,10 @@ class UserIsAuthorizedTests(TestCase):
     
     def test_index_page_cached(self):
         """
-        Тесты, которые проверяют работу кэша
+        Тесты, которые проверяют работу кэша: карточки постов берутся
+        из кэша, а изменение поста сразу сбрасывает только его карточку
         """
+        cache.clear()
         test_text = "Test post for check cache"
         post = Post.objects.create(
             text=test_text,
@@ -272,14 +315,25 @@ class UserIsAuthorizedTests(TestCase):
         )
         response_1 = self.client.get(reverse('index'))
         self.assertContains(response_1, post.text)
-        
-        post.delete()
-        response_2 = self.client.get(reverse('index'))
+
+        with patch('posts.cards.render_to_string') as render:
+            response_2 = self.client.get(reverse('index'))
+        render.assert_not_called()
         self.assertEqual(response_1.content, response_2.content)
-        
-        cache.clear()
-        response_3 = self.client.get(reverse('index'))
-        self.assertNotEqual(response_1.content, response_3.content)
+
+        post.text = "Edited text for check cache"
+        post.save()
+        with patch(
+            'posts.cards.render_to_string', wraps=render_to_string
+        ) as render:
+            response_3 = self.client.get(reverse('index'))
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(response_3, post.text)
+        self.assertNotContains(response_3, test_text)
+
+        post.delete()
+        response_4 = self.client.get(reverse('index'))
+        self.assertNotContains(response_4, post.text)
 
     def test_follow(self):
         """
@@ -400,3 +454,1632 @@ class UserIsAuthorizedTests(TestCase):
             response,
             f'/auth/login/?next=/{self.second_user}/1/comment'
         )
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="scroller",
+            password="123456"
+        )
+        self.group = Group.objects.create(title="Deep", slug="deep")
+        self.posts = [
+            Post.objects.create(
+                text=f"Cursor post {i}",
+                author=self.author,
+                group=self.group
+            )
+            for i in range(25)
+        ]
+
+    def walk(self, url):
+        """
+        Проходит ленту по курсорам до конца и возвращает id постов
+        """
+        seen = []
+        response = self.client.get(url, {'cursor': ''})
+        while True:
+            page = response.context['page']
+            seen.extend(post.id for post in page)
+            if not page.has_next():
+                return seen, page
+            response = self.client.get(url, {'cursor': page.next_cursor})
+
+    def test_cursor_pages_cover_feed_in_order(self):
+        """
+        Курсорная пагинация отдает все посты без пропусков и повторов
+        """
+        expected = [post.id for post in reversed(self.posts)]
+        urls = [
+            reverse('index'),
+            reverse('group_posts', args=[self.group.slug]),
+            reverse('profile', args=[self.author.username]),
+        ]
+        for url in urls:
+            seen, last_page = self.walk(url)
+            self.assertEqual(seen, expected)
+            self.assertTrue(last_page.has_previous())
+
+    def test_previous_cursor_returns_previous_page(self):
+        url = reverse('index')
+        first = self.client.get(url, {'cursor': ''}).context['page']
+        second = self.client.get(
+            url, {'cursor': first.next_cursor}
+        ).context['page']
+        back = self.client.get(
+            url, {'cursor': second.previous_cursor}
+        ).context['page']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_cursor_page_skips_count_query(self):
+        """
+        В курсорном режиме нет COUNT(*) и OFFSET
+        """
+        url = reverse('index')
+        first = self.client.get(url, {'cursor': ''}).context['page']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'cursor': first.next_cursor})
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('COUNT(*)', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_numbered_pages_lead_into_cursor_mode(self):
+        """
+        После первых страниц ссылка "Следующая" переводит ленту
+        в курсорный режим и продолжает ее без пропусков
+        """
+        url = reverse('index')
+        with patch('posts.views.NUMBERED_PAGES', 2):
+            first = self.client.get(url)
+            self.assertContains(first, '?page=2')
+            self.assertNotContains(first, '?page=3')
+            second = self.client.get(url, {'page': 2})
+        cursor = second.context['page'].next_cursor
+        self.assertContains(second, f'?cursor={cursor}')
+        third = self.client.get(url, {'cursor': cursor}).context['page']
+        self.assertEqual(
+            [post.id for post in third],
+            [post.id for post in reversed(self.posts[:5])]
+        )
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('index'), {'cursor': 'garbage!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'][0], self.posts[-1])
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class FeedQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username="reader",
+            password="123456"
+        )
+        self.group = Group.objects.create(title="Budget", slug="budget")
+        self.authors = [
+            User.objects.create_user(username=f"writer{i}", password="123456")
+            for i in range(3)
+        ]
+        for i in range(12):
+            author = self.authors[i % 3]
+            post = Post.objects.create(
+                text=f"Budget post {i}",
+                author=author,
+                group=self.group
+            )
+            for _ in range(i % 4):
+                Comment.objects.create(
+                    post=post,
+                    author=self.reader,
+                    text="comment"
+                )
+        for author in self.authors:
+            Follow.objects.create(user=self.reader, author=author)
+        self.client.force_login(self.reader)
+
+    def test_listing_query_budget(self):
+        """
+        Страница ленты из 10 постов собирается за постоянное число запросов:
+        сессия, пользователь, COUNT(*) и сам список (+ объект страницы)
+        """
+        budget = [
+            (reverse('index'), 4),
+            (reverse('group_posts', args=[self.group.slug]), 5),
+            (reverse('profile', args=[self.authors[0].username]), 6),
+            (reverse('follow_index'), 4),
+        ]
+        for url, queries in budget:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.client.get(url)
+
+    def test_comment_count_annotation(self):
+        response = self.client.get(reverse('index'))
+        for post in response.context['page']:
+            self.assertEqual(post.comment_count, post.comments.count())
+        self.assertContains(response, '3 комментариев')
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username="inbox",
+            password="123456"
+        )
+        self.author = User.objects.create_user(
+            username="poster",
+            password="123456"
+        )
+        self.old_post = Post.objects.create(
+            text="Written before follow",
+            author=self.author
+        )
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        return list(self.client.get(reverse('follow_index')).context['page'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """
+        Подписка переносит старые посты автора в ленту, отписка их убирает
+        """
+        self.client.get(reverse('profile_follow', args=[self.author]))
+        self.assertEqual(self.feed(), [self.old_post])
+
+        self.client.get(reverse('profile_unfollow', args=[self.author]))
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text="Fresh", author=self.author)
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        self.assertEqual(
+            TimelineEntry.objects.get(post=new_post).pub_date,
+            new_post.pub_date
+        )
+
+    def test_feed_reads_timeline_only(self):
+        """
+        Лента подписок читается из таблицы таймлайна, без JOIN на Follow
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('follow_index'), {'cursor': ''})
+        sql = queries[-1]['sql']
+        self.assertIn('posts_timelineentry', sql)
+        self.assertNotIn('posts_follow', sql)
+
+    @patch('posts.timeline.TIMELINE_LENGTH', 3)
+    def test_trim_caps_inbox(self):
+        for i in range(5):
+            Post.objects.create(text=f"Capped {i}", author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(TimelineEntry.objects.count(), 3)
+        Post.objects.create(text="One more", author=self.author)
+        timeline.trim([self.reader.pk])
+        newest = Post.objects.filter(author=self.author)[:3]
+        self.assertEqual(self.feed(), list(newest))
+
+    def test_rebuild_timelines_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), [self.old_post])
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="counted",
+            password="123456"
+        )
+        self.fan = User.objects.create_user(
+            username="fan",
+            password="123456"
+        )
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_counters_follow_writes(self):
+        """
+        Счетчики меняются вместе с созданием и удалением постов и подписок
+        """
+        post = Post.objects.create(text="Counted", author=self.author)
+        Post.objects.create(text="Counted twice", author=self.author)
+        follow = Follow.objects.create(user=self.fan, author=self.author)
+        self.assertStats(self.author, 2, 1, 0)
+        self.assertStats(self.fan, 0, 0, 1)
+
+        post.delete()
+        follow.delete()
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.fan, 0, 0, 0)
+
+    def test_delete_after_drift(self):
+        """
+        Удаление не падает, если счетчик уже ушел в ноль
+        """
+        post = Post.objects.create(text="Counted", author=self.author)
+        follow = Follow.objects.create(user=self.fan, author=self.author)
+        UserStats.objects.update(
+            posts_count=0, followers_count=0, following_count=0
+        )
+        post.delete()
+        follow.delete()
+        self.assertStats(self.author, 0, 0, 0)
+        self.assertStats(self.fan, 0, 0, 0)
+
+    def test_card_reads_counters(self):
+        Post.objects.create(text="Counted", author=self.author)
+        Follow.objects.create(user=self.fan, author=self.author)
+        response = self.client.get(reverse('profile', args=[self.author]))
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertContains(response, 'Записей: 1')
+        self.assertEqual(response.context['stats'].posts_count, 1)
+
+    def test_reconcile_fixes_drift(self):
+        Post.objects.create(text="Counted", author=self.author)
+        UserStats.objects.filter(user=self.author).update(
+            posts_count=42,
+            followers_count=7
+        )
+        UserStats.objects.filter(user=self.fan).delete()
+        out = StringIO()
+        call_command('reconcile_user_stats', stdout=out)
+        self.assertIn('2 user(s)', out.getvalue())
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.fan, 0, 0, 0)
+
+
+@override_settings(CACHES=SQLITE_CACHES)
+class PostCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="cached",
+            password="123456"
+        )
+        self.group = Group.objects.create(title="Old title", slug="cards")
+        self.post = Post.objects.create(
+            text="Cached card",
+            author=self.author,
+            group=self.group
+        )
+
+    def test_cards_are_per_page(self):
+        """
+        В отличие от старого блока index_page, каждая страница своя
+        """
+        for i in range(10):
+            Post.objects.create(text=f"Filler {i}", author=self.author)
+        first = self.client.get(reverse('index'))
+        second = self.client.get(reverse('index'), {'page': 2})
+        self.assertNotContains(first, "Cached card")
+        self.assertContains(second, "Cached card")
+
+    def test_comment_author_and_group_changes_invalidate(self):
+        url = reverse('index')
+        self.client.get(url)
+
+        Comment.objects.create(post=self.post, author=self.author, text="c")
+        self.assertContains(self.client.get(url), '1 комментариев')
+
+        self.group.title = "New title"
+        self.group.save()
+        self.assertContains(self.client.get(url), '#New title')
+
+        self.author.username = "renamed"
+        self.author.save()
+        self.assertContains(self.client.get(url), '@renamed')
+
+    def test_owner_sees_edit_link(self):
+        url = reverse('index')
+        self.assertNotContains(self.client.get(url), 'Редактировать')
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(url), 'Редактировать')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(
+            os.path.join(self.directory.name, 'cache.sqlite3'),
+            {'OPTIONS': options}
+        )
+
+    def test_get_set_and_ttl(self):
+        self.cache.set('card', {'html': '<p>'}, 60)
+        self.cache.set('gone', 'x', -1)
+        self.assertEqual(self.cache.get('card'), {'html': '<p>'})
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertEqual(
+            self.cache.get_many(['card', 'gone', 'missing']),
+            {'card': {'html': '<p>'}}
+        )
+
+    def test_add_and_incr_are_atomic(self):
+        self.assertTrue(self.cache.add('version', 1))
+        self.assertFalse(self.cache.add('version', 100))
+        self.assertEqual(self.cache.incr('version'), 2)
+        self.assertEqual(self.cache.decr('version', 2), 0)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 1, -1)
+        self.assertTrue(self.cache.add('expired', 5))
+        self.assertEqual(self.cache.get('expired'), 5)
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(
+            MAX_ENTRIES=10,
+            CULL_FREQUENCY=5,
+            CULL_CHECK_EVERY=1,
+            ACCESS_RESOLUTION=0
+        )
+        for i in range(10):
+            cache.set(f'key{i}', i)
+        cache.get('key0')
+        cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key10'), 10)
+
+    def test_shared_between_processes(self):
+        """
+        Значения и инкременты, сделанные в дочернем процессе,
+        видны родителю
+        """
+        self.cache.set('version', 1)
+        process = multiprocessing.get_context('fork').Process(
+            target=bump_shared_cache,
+            args=(self.cache,)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(self.cache.get('version'), 11)
+        self.assertEqual(self.cache.get('from-child'), 'hello')
+
+
+def bump_shared_cache(shared_cache):
+    for _ in range(10):
+        shared_cache.incr('version')
+    shared_cache.set('from-child', 'hello')
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="searcher",
+            password="123456"
+        )
+        self.best = Post.objects.create(
+            text="Кукарача кукарача кукарача",
+            author=self.author
+        )
+        self.other = Post.objects.create(
+            text="Кукарача и много других слов про пароход и дым",
+            author=self.author
+        )
+        Post.objects.create(text="Совсем про другое", author=self.author)
+
+    def test_search_ranks_matches(self):
+        response = self.client.get(reverse('search'), {'q': 'кукарача'})
+        self.assertEqual(
+            list(response.context['page']),
+            [self.best, self.other]
+        )
+        self.assertNotContains(response, 'Совсем про другое')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.text = "Теперь про пароход"
+        self.other.save()
+        self.best.delete()
+        found = search.search('кукарача')
+        self.assertEqual(list(found), [])
+        self.assertEqual(list(search.search('пароход')), [self.other])
+
+    def test_search_cursor_pages(self):
+        for i in range(12):
+            Post.objects.create(text=f"Пароход номер {i}", author=self.author)
+        first = search.search('пароход', per_page=10)
+        second = search.search('пароход', first.next_cursor, per_page=10)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        self.assertFalse(set(first) & set(second))
+
+    def test_operators_in_query_are_harmless(self):
+        for query in ['"', 'кукарача OR', 'NEAR(', '*', '']:
+            response = self.client.get(reverse('search'), {'q': query})
+            self.assertEqual(response.status_code, 200)
+
+    def test_search_json(self):
+        response = self.client.get(reverse('search_json'), {'q': 'дым'})
+        data = response.json()
+        self.assertEqual([hit['id'] for hit in data['results']], [self.other.id])
+        self.assertEqual(data['results'][0]['author'], 'searcher')
+        self.assertIsNone(data['next_cursor'])
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@mail.com",
+            password="123456"
+        )
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/admin/posts/post/', {'q': 'пароход'}
+            )
+        self.assertContains(response, f'/admin/posts/post/{self.other.id}/')
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+@override_settings(CACHES=DUMMY_CACHES, THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="photographer",
+            password="123456"
+        )
+        self.client.force_login(self.author)
+
+    def upload(self, name='photo.gif'):
+        return SimpleUploadedFile(name, SMALL_GIF, content_type='image/gif')
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_concurrent_requests_are_coalesced(self):
+        post = Post.objects.create(
+            text="Photo", author=self.author, image=self.upload()
+        )
+        release = threading.Event()
+
+        def slow_generate(image):
+            release.wait(5)
+            return True
+
+        with patch('posts.thumbnails.generate', side_effect=slow_generate) \
+                as generate:
+            first = thumbnails.schedule(post)
+            second = thumbnails.schedule(post)
+            release.set()
+            self.assertTrue(first.result(5))
+        self.assertIs(first, second)
+        generate.assert_called_once()
+
+    def test_placeholder_until_ready(self):
+        post = Post.objects.create(
+            text="Photo", author=self.author, image=self.upload()
+        )
+        with patch('posts.thumbnails.schedule') as schedule:
+            response = self.client.get(reverse('index'))
+        schedule.assert_called_once_with(post)
+        self.assertContains(response, 'data:image/gif;base64')
+
+    def test_new_post_upload_generates_thumbnail(self):
+        self.client.post(
+            reverse('new_post'),
+            {'text': 'Uploaded', 'image': self.upload()}
+        )
+        post = Post.objects.get(text='Uploaded')
+        self.assertTrue(post.image)
+        thumbnail_file = thumbnails.card_thumbnail_file(post.image)
+        self.assertIsNotNone(sorl_default.kvstore.get(thumbnail_file))
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, thumbnail_file.url)
+
+    def test_generate_thumbnails_command(self):
+        post = Post.objects.create(
+            text="Old photo", author=self.author, image=self.upload()
+        )
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Created 1', out.getvalue())
+        thumbnail_file = thumbnails.card_thumbnail_file(post.image)
+        self.assertIsNotNone(sorl_default.kvstore.get(thumbnail_file))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_database_errors_are_retried(self):
+        """
+        Временная ошибка базы не помечает картинку как битую
+        """
+        cache.clear()
+        post = Post.objects.create(
+            text="Photo", author=self.author, image=self.upload()
+        )
+
+        def locked(*args, **kwargs):
+            # Like a failing Model.save(), which marks the enclosing
+            # transaction for rollback.
+            with transaction.atomic(savepoint=False):
+                raise OperationalError('database table is locked')
+
+        with patch('posts.thumbnails.get_thumbnail', side_effect=locked), \
+                self.assertLogs('posts.thumbnails', 'WARNING'):
+            self.assertFalse(thumbnails.generate(post.image))
+        # The test's transaction is still usable.
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertTrue(thumbnails.generate(post.image))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_broken_images_are_not_retried(self):
+        cache.clear()
+        post = Post.objects.create(
+            text="Broken", author=self.author,
+            image=SimpleUploadedFile('broken.gif', b'GIF89a', 'image/gif')
+        )
+        with self.assertLogs('sorl.thumbnail', 'ERROR'):
+            self.assertFalse(thumbnails.generate(post.image))
+        with patch('posts.thumbnails.get_thumbnail') as get_thumbnail:
+            self.assertFalse(thumbnails.generate(post.image))
+        get_thumbnail.assert_not_called()
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_placeholder_cards_expire_soon(self):
+        cache.clear()
+        Post.objects.create(
+            text="Photo", author=self.author, image=self.upload()
+        )
+        with patch('posts.thumbnails.schedule'):
+            self.client.get(reverse('index'))
+        locmem = caches['default']
+        expiries = [
+            expiry - time.time()
+            for key, expiry in locmem._expire_info.items()
+            if key.startswith(locmem.make_key('card:'))
+            and not key.startswith(locmem.make_key('card:v:'))
+        ]
+        self.assertEqual(len(expiries), 1)
+        self.assertLessEqual(expiries[0], cards.PLACEHOLDER_TIMEOUT)
+
+
+@override_settings(CACHES=DUMMY_CACHES, THUMBNAIL_WORKERS=0)
+class ThumbnailPrefetchTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="gallery",
+            password="123456"
+        )
+        for i in range(5):
+            post = Post.objects.create(
+                text=f"Photo {i}",
+                author=self.author,
+                image=SimpleUploadedFile(
+                    f'photo{i}.gif', SMALL_GIF, content_type='image/gif'
+                )
+            )
+            thumbnails.generate(post.image)
+
+    def test_page_thumbnails_are_looked_up_in_one_query(self):
+        """
+        Метаданные миниатюр всей страницы достаются одним запросом
+        к KVStore, а не запросом на каждую картинку
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        kvstore_queries = [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in response.context['page']:
+            self.assertEqual(
+                post.prefetched_thumbnail.name,
+                thumbnails.card_thumbnail_file(post.image).name
+            )
+            self.assertContains(response, post.prefetched_thumbnail.url)
+
+
+def make_jpeg(size, orientation=None):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x010f] = 'Camera maker'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=DUMMY_CACHES, THUMBNAIL_WORKERS=0)
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="camera",
+            password="123456"
+        )
+        self.client.force_login(self.author)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=400)
+    def test_upload_is_downscaled_rotated_and_stripped(self):
+        """
+        Фото с камеры уменьшается, поворачивается по EXIF и теряет EXIF
+        """
+        upload = SimpleUploadedFile(
+            'camera.jpg',
+            make_jpeg((1600, 1200), orientation=6),
+            content_type='image/jpeg'
+        )
+        self.client.post(
+            reverse('new_post'),
+            {'text': 'From camera', 'image': upload}
+        )
+        post = Post.objects.get(text='From camera')
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (300, 400))
+            self.assertEqual(dict(stored.getexif()), {})
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_is_rejected(self):
+        upload = SimpleUploadedFile(
+            'huge.jpg',
+            make_jpeg((800, 800)) + b'\0' * 4096,
+            content_type='image/jpeg'
+        )
+        response = self.client.post(
+            reverse('new_post'),
+            {'text': 'Too big', 'image': upload}
+        )
+        self.assertFormError(
+            response,
+            'form',
+            'image',
+            'Файл слишком большой. Максимальный размер: 1,0\xa0КБ.'
+        )
+        self.assertFalse(Post.objects.filter(text='Too big').exists())
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class FeedApiTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="writer",
+            password="123456"
+        )
+        self.reader = User.objects.create_user(
+            username="reader",
+            password="123456"
+        )
+        self.group = Group.objects.create(title="API", slug="api")
+        self.posts = [
+            Post.objects.create(
+                text=f"Post {i}",
+                author=self.author,
+                group=self.group if i % 2 else None
+            )
+            for i in range(15)
+        ]
+        Comment.objects.create(
+            post=self.posts[-1], author=self.reader, text="Первый"
+        )
+
+    def test_index_walks_with_cursor(self):
+        first = self.client.get(reverse('api_posts')).json()
+        second = self.client.get(
+            reverse('api_posts'), {'cursor': first['next_cursor']}
+        ).json()
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+        self.assertIsNone(first['previous_cursor'])
+        self.assertIsNone(second['next_cursor'])
+        latest = first['results'][0]
+        self.assertEqual(
+            latest['author'],
+            {'id': self.author.id, 'username': 'writer'}
+        )
+        self.assertIsNone(latest['group'])
+        self.assertEqual(latest['comment_count'], 1)
+        self.assertEqual(first['results'][1]['group']['slug'], 'api')
+
+    def test_index_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('api_posts'), {'limit': 50})
+
+    def test_group_and_user_feeds(self):
+        response = self.client.get(
+            reverse('api_group_posts', args=['api']), {'limit': 100}
+        )
+        self.assertEqual(len(response.json()['results']), 7)
+        response = self.client.get(reverse('api_user_posts', args=['reader']))
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get(reverse('api_group_posts', args=['none']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_follow_feed_requires_login(self):
+        response = self.client.get(reverse('api_follow'))
+        self.assertEqual(response.status_code, 401)
+        self.client.force_login(self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        data = self.client.get(reverse('api_follow')).json()
+        self.assertEqual(data['results'][0]['id'], self.posts[-1].id)
+
+    def test_post_and_comments(self):
+        post = self.posts[-1]
+        data = self.client.get(reverse('api_post', args=[post.id])).json()
+        self.assertEqual(data['text'], 'Post 14')
+        data = self.client.get(
+            reverse('api_post_comments', args=[post.id])
+        ).json()
+        self.assertEqual(data['results'][0]['text'], 'Первый')
+        self.assertEqual(data['results'][0]['author']['username'], 'reader')
+        response = self.client.get(reverse('api_post', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="etag",
+            password="123456"
+        )
+        self.post = Post.objects.create(text="Первый", author=self.author)
+
+    def revalidate(self, url, response):
+        return self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+
+    def test_unchanged_index_is_not_rendered(self):
+        url = reverse('index')
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        with self.assertNumQueries(0):
+            again = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+
+    def test_new_post_changes_validators(self):
+        url = reverse('index')
+        response = self.client.get(url)
+        Post.objects.create(text="Второй", author=self.author)
+        again = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 200)
+        self.assertContains(again, "Второй")
+        self.assertNotEqual(again['ETag'], response['ETag'])
+
+    def test_comment_fragment_and_page_have_own_etags(self):
+        """
+        Фрагмент комментариев для XHR и полная страница не подменяют
+        друг друга при ревалидации
+        """
+        url = reverse('post_comments', args=['etag', self.post.id])
+        xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        page = self.client.get(url)
+        fragment = self.client.get(url, **xhr)
+        self.assertNotEqual(page['ETag'], fragment['ETag'])
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=page['ETag'], **xhr)
+        self.assertEqual(again.status_code, 200)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=fragment['ETag'])
+        self.assertEqual(again.status_code, 200)
+        again = self.client.get(
+            url, HTTP_IF_NONE_MATCH=fragment['ETag'], **xhr
+        )
+        self.assertEqual(again.status_code, 304)
+
+    def test_post_page_follows_comments(self):
+        url = reverse('post', args=['etag', self.post.id])
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.author, text="Комментарий"
+        )
+        self.assertContains(self.revalidate(url, response), "Комментарий")
+
+    def test_validators_are_per_viewer(self):
+        url = reverse('profile', args=['etag'])
+        anonymous = self.client.get(url)
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertNotEqual(anonymous['ETag'], response['ETag'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 200)
+
+    def test_follow_changes_follow_feed(self):
+        reader = User.objects.create_user(username="reader", password="1")
+        self.client.force_login(reader)
+        url = reverse('follow_index')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertContains(self.revalidate(url, response), "Первый")
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class ImportPostsTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="old", password="1")
+        self.reader = User.objects.create_user(username="fan", password="1")
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(title="Архив", slug="archive")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def test_jsonl_import_keeps_timestamps(self):
+        path = self.write('dump.jsonl', "\n".join([
+            '{"id": 100, "author": "old", "group": "archive", '
+            '"text": "Старый пост", "pub_date": "2015-03-01T10:00:00+00:00"}',
+            '{"type": "comment", "post": 100, "author": "fan", '
+            '"text": "Ответ", "created": "2015-03-02T10:00:00+00:00"}',
+            '{"author": "nobody", "text": "Потерянный"}',
+            '{"type": "comment", "post": 999, "author": "fan", "text": "?"}',
+        ]))
+        out = StringIO()
+        call_command('import_posts', path, '--batch-size', '2', stdout=out)
+        self.assertIn(
+            'Imported 1 post(s) and 1 comment(s), skipped 2',
+            out.getvalue()
+        )
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.comments.get().created.day, 2)
+        self.assertEqual(UserStats.objects.get(pk=self.author.pk).posts_count, 1)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        new = Post.objects.create(text="Новый", author=self.author)
+        self.assertGreater(new.pk, 100)
+        self.assertGreater(new.pub_date.year, 2015)
+
+    def test_csv_import_creates_missing_authors(self):
+        path = self.write('dump.csv', (
+            "type,id,post,author,group,text,pub_date,created\n"
+            "post,,,newbie,,Из CSV,2016-01-01 12:00:00,\n"
+        ))
+        call_command(
+            'import_posts', path, '--create-missing', stdout=StringIO()
+        )
+        post = Post.objects.get(text="Из CSV")
+        self.assertEqual(post.author.username, "newbie")
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(post.pub_date.year, 2016)
+
+    def test_import_can_be_repeated(self):
+        path = self.write(
+            'dump.jsonl', '{"id": 7, "author": "old", "text": "Один раз"}\n'
+        )
+        call_command('import_posts', path, stdout=StringIO())
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertEqual(Post.objects.filter(text="Один раз").count(), 1)
+        self.assertIn(
+            'Imported 0 post(s) and 0 comment(s), skipped 0 invalid and '
+            '1 existing row(s)',
+            out.getvalue()
+        )
+
+    def test_rows_without_id_are_reported(self):
+        path = self.write(
+            'dump.jsonl', '{"author": "old", "text": "Без id"}\n'
+        )
+        err = StringIO()
+        call_command('import_posts', path, stdout=StringIO(), stderr=err)
+        self.assertIn('1 post(s) and comment(s) had no id', err.getvalue())
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class ExportContentTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="writer", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.group = Group.objects.create(title="Группа", slug="group")
+        self.old = Post.objects.create(
+            text="Старый", author=self.author, group=self.group
+        )
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=self.old.pub_date.replace(year=2010)
+        )
+        self.new = Post.objects.create(text="Новый", author=self.author)
+        Comment.objects.create(post=self.new, author=self.reader, text="Ок")
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_content', *args, stdout=out, stderr=StringIO())
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_exports_all_tables(self):
+        rows = self.export()
+        self.assertEqual(
+            [row['type'] for row in rows],
+            ['post', 'post', 'comment', 'follow']
+        )
+        self.assertEqual(rows[0]['group'], 'group')
+        self.assertEqual(rows[2]['post'], self.new.pk)
+        self.assertEqual(rows[3], {
+            'type': 'follow', 'id': rows[3]['id'],
+            'user': 'reader', 'author': 'writer'
+        })
+
+    def test_incremental_export(self):
+        rows = self.export('--only', 'posts', '--since', '2015-01-01')
+        self.assertEqual([row['text'] for row in rows], ['Новый'])
+        rows = self.export('--only', 'posts', '--since-id', str(self.old.pk))
+        self.assertEqual([row['text'] for row in rows], ['Новый'])
+
+    def test_watermark_per_table(self):
+        """
+        У каждой таблицы свой водяной знак: id постов не влияют
+        на выгрузку комментариев и подписок
+        """
+        comment = Comment.objects.get()
+        follow = Follow.objects.get()
+        rows = self.export(
+            '--since-post-id', str(self.new.pk),
+            '--since-comment-id', str(comment.pk - 1),
+        )
+        self.assertEqual(
+            [(row['type'], row['id']) for row in rows],
+            [('comment', comment.pk), ('follow', follow.pk)]
+        )
+        err = StringIO()
+        call_command(
+            'export_content', stdout=StringIO(), stderr=err,
+        )
+        self.assertIn(
+            f'--since-post-id {self.new.pk} '
+            f'--since-comment-id {comment.pk} '
+            f'--since-follow-id {follow.pk}',
+            err.getvalue()
+        )
+        with self.assertRaises(CommandError):
+            self.export('--since-id', str(self.old.pk))
+
+    def test_gzip_file_can_be_imported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dump.jsonl.gz')
+            call_command(
+                'export_content', '--output', path, stderr=StringIO()
+            )
+            with gzip.open(path, 'rt', encoding='utf-8') as stream:
+                rows = [json.loads(line) for line in stream]
+            self.assertEqual(len(rows), 4)
+            plain = os.path.join(directory, 'dump.jsonl')
+            with open(plain, 'w', encoding='utf-8') as stream:
+                stream.writelines(json.dumps(row) + "\n" for row in rows)
+            Post.objects.all().delete()
+            call_command('import_posts', plain, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.get().text, 'Ок')
+        self.assertEqual(Post.objects.get(text="Старый").pub_date.year, 2010)
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="planner", password="1")
+        self.reader = User.objects.create_user(username="reader", password="1")
+        self.group = Group.objects.create(title="Планы", slug="plans")
+        for i in range(3):
+            post = Post.objects.create(
+                text=f"План {i}", author=self.author, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.reader, text="!")
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_paginator_count_skips_comment_counter(self):
+        with CaptureQueriesContext(connection) as queries:
+            count = Post.objects.for_feed().filter(group=self.group).count()
+        self.assertEqual(count, 3)
+        self.assertNotIn('posts_comment', queries.captured_queries[0]['sql'])
+
+    def test_views_use_indexes(self):
+        out = StringIO()
+        call_command('explain_views', '--fail', stdout=out)
+        self.assertIn('follow_index', out.getvalue())
+        self.assertIn('All query plans use indexes.', out.getvalue())
+        self.assertEqual(Post.objects.count(), 3)
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class SeedDataTests(TestCase):
+    def seed(self, *args):
+        call_command(
+            'seed_data', '--users', '40', '--groups', '3', '--posts', '300',
+            '--comments', '500', '--follows', '5', *args, stdout=StringIO()
+        )
+
+    def test_dataset_is_complete_and_skewed(self):
+        self.seed()
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 500)
+        followers = sorted(
+            (author.following.count() for author in User.objects.all()),
+            reverse=True
+        )
+        self.assertGreater(followers[0], followers[len(followers) // 2] * 3)
+        top = User.objects.order_by('pk')[0]
+        self.assertEqual(top.stats.followers_count, top.following.count())
+        reader = Follow.objects.first().user
+        self.assertTrue(TimelineEntry.objects.filter(user=reader).exists())
+        dates = list(
+            Post.objects.order_by('pk').values_list('pub_date', flat=True)
+        )
+        self.assertEqual(dates, sorted(dates))
+
+    def test_same_seed_same_data(self):
+        self.seed('--seed', '7')
+        first = list(Post.objects.order_by('pk').values_list('text', flat=True))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        self.seed('--seed', '7')
+        second = list(Post.objects.order_by('pk').values_list('text', flat=True))
+        self.assertEqual(first, second)
+
+    def test_images_are_attached(self):
+        with tempfile.TemporaryDirectory() as media:
+            with override_settings(MEDIA_ROOT=media):
+                self.seed('--images', '2', '--image-ratio', '0.5')
+                stored = os.listdir(os.path.join(media, 'posts'))
+                self.assertEqual(len(stored), 2)
+        with_image = Post.objects.exclude(image='').exclude(image=None)
+        self.assertTrue(100 < with_image.count() < 200)
+
+
+@override_settings(CACHES=SQLITE_CACHES)
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="timed",
+            password="123456"
+        )
+        Post.objects.create(text="Замер", author=self.author)
+
+    def timing(self, response):
+        """Разбирает Server-Timing в словарь имя -> параметры"""
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        timing = self.timing(response)
+        self.assertEqual(
+            set(timing), {'db', 'tpl', 'thumb', 'cache', 'total'}
+        )
+        self.assertEqual(
+            timing['db']['desc'], f'"{len(queries.captured_queries)} queries"'
+        )
+        self.assertGreater(float(timing['tpl']['dur']), 0)
+        self.assertGreaterEqual(
+            float(timing['total']['dur']), float(timing['tpl']['dur'])
+        )
+
+    def test_cache_hits_and_misses(self):
+        url = reverse('profile', args=['timed'])
+        first = self.timing(self.client.get(url))
+        second = self.timing(self.client.get(url))
+        self.assertNotIn(' 0 misses', first['cache']['desc'])
+        self.assertIn(' 0 misses', second['cache']['desc'])
+
+    def test_metrics_are_aggregated_per_url_name(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.get(reverse('profile', args=['timed']))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="index"} 2', body
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="profile"} 1', body
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="index",le="+Inf"} 2',
+            body
+        )
+        self.assertIn(
+            'yatube_responses_total{view="index",code="200"} 2', body
+        )
+        self.assertIn('# TYPE yatube_db_queries histogram', body)
+
+    def test_metrics_are_internal(self):
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='203.0.113.5'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=SQLITE_CACHES)
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        self.logs = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.logs.name, 'slow.log')
+        self.author = User.objects.create_user(
+            username="slow",
+            password="123456"
+        )
+        Post.objects.create(text="Медленно", author=self.author)
+
+    def tearDown(self):
+        self.logs.cleanup()
+
+    def test_fingerprint_strips_literals(self):
+        first = slow_queries.fingerprint(
+            "SELECT * FROM posts_post WHERE id IN (%s, %s, %s) "
+            "AND text = 'a' LIMIT 21"
+        )
+        second = slow_queries.fingerprint(
+            "SELECT *  FROM posts_post\nWHERE id IN (%s) "
+            "AND text = 'it''s' LIMIT 5"
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(
+            first[1],
+            "SELECT * FROM posts_post WHERE id IN (...) AND text = ? LIMIT ?"
+        )
+        self.assertEqual(
+            slow_queries.normalize('INSERT INTO "t3" VALUES (?, ?), (?, ?)'),
+            'INSERT INTO "t3" VALUES (...)'
+        )
+
+    def test_disabled_by_default(self):
+        with override_settings(SLOW_QUERY_LOG=self.log):
+            Client().get(reverse('index'))
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_slow_queries_are_logged_and_aggregated(self):
+        with override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_LOG=self.log):
+            client = Client()
+            client.get(reverse('index'))
+            client.get(reverse('index'))
+            client.get(reverse('profile', args=['slow']))
+            records = list(slow_queries.read_log())
+        self.assertEqual(
+            {record['view'] for record in records}, {'index', 'profile'}
+        )
+        stats = slow_queries.aggregate(records)
+        self.assertLess(len(stats), len(records))
+        self.assertEqual(
+            sum(entry['count'] for entry in stats.values()), len(records)
+        )
+
+        out = StringIO()
+        call_command(
+            'slow_queries', '--log', self.log, '--view', 'profile',
+            '--limit', '3', stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn('views: profile', output)
+        self.assertNotIn('index', output)
+        self.assertIn('fingerprint(s) in 1 log file(s)', output)
+
+
+@override_settings(CACHES=SQLITE_CACHES)
+class PostMarkupTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="writer",
+            password="123456"
+        )
+        self.client.force_login(self.author)
+
+    def test_body_is_rendered_on_save(self):
+        self.client.post(
+            reverse('new_post'), {'text': 'Первая <b>строка</b>\nвторая'}
+        )
+        post = Post.objects.get()
+        self.assertEqual(
+            post.text_html, 'Первая &lt;b&gt;строка&lt;/b&gt;<br>вторая'
+        )
+        self.assertEqual(post.excerpt, '')
+        self.client.post(
+            reverse('post_edit', args=['writer', post.id]),
+            {'text': 'Новый\nтекст'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, 'Новый<br>текст')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Новый<br>текст', html=False)
+
+    def test_long_posts_are_listed_by_excerpt(self):
+        text = 'слово ' * 200 + 'финал'
+        post = Post.objects.create(text=text, author=self.author)
+        self.assertTrue(post.excerpt.endswith('…'))
+        self.assertLessEqual(len(post.excerpt), 501)
+        self.assertNotIn('финал', post.excerpt)
+        listing = self.client.get(reverse('profile', args=['writer']))
+        self.assertNotContains(listing, 'финал')
+        self.assertContains(listing, 'Читать дальше')
+        page = self.client.get(reverse('post', args=['writer', post.id]))
+        self.assertContains(page, 'финал')
+
+    def test_backfill_command(self):
+        post = Post.objects.create(text='Старый\nпост', author=self.author)
+        Post.objects.filter(pk=post.pk).update(text_html='', excerpt='')
+        out = StringIO()
+        call_command('render_posts', stdout=out)
+        self.assertIn('Rendered 1 of 1 post(s)', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, 'Старый<br>пост')
+        out = StringIO()
+        call_command('render_posts', '--all', stdout=out)
+        self.assertIn('Rendered 0 of 1 post(s)', out.getvalue())
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class CommentPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="viral",
+            password="123456"
+        )
+        self.post = Post.objects.create(text="Популярный", author=self.author)
+
+    def comment(self, count):
+        """Каждый комментарий пишет новый читатель"""
+        start = Comment.objects.count()
+        for index in range(start, start + count):
+            reader = User.objects.create(username=f"reader{index}")
+            Comment.objects.create(
+                post=self.post, author=reader, text=f"Комментарий {index}"
+            )
+
+    def get_post(self):
+        return self.client.get(reverse('post', args=['viral', self.post.id]))
+
+    def test_post_page_queries_do_not_grow(self):
+        self.comment(5)
+        with CaptureQueriesContext(connection) as few:
+            self.get_post()
+        self.comment(60)
+        with CaptureQueriesContext(connection) as many:
+            response = self.get_post()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(response.context['comments']), 20)
+        self.assertIsNotNone(response.context['next_cursor'])
+        self.assertContains(response, 'Показать ещё')
+
+    def test_load_more_walks_all_comments(self):
+        self.comment(45)
+        response = self.get_post()
+        seen = [comment.pk for comment in response.context['comments']]
+        cursor = response.context['next_cursor']
+        url = reverse('post_comments', args=['viral', self.post.id])
+        while cursor:
+            fragment = self.client.get(
+                url, {'cursor': cursor}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+            self.assertNotContains(fragment, '<html')
+            seen += [comment.pk for comment in fragment.context['comments']]
+            cursor = fragment.context['next_cursor']
+        expected = list(
+            Comment.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        self.assertEqual(seen, expected)
+
+    def test_comments_page_without_javascript(self):
+        self.comment(25)
+        cursor = self.get_post().context['next_cursor']
+        response = self.client.get(
+            reverse('post_comments', args=['viral', self.post.id]),
+            {'cursor': cursor}
+        )
+        self.assertContains(response, '<html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertIn('X-Requested-With', response['Vary'])
+
+    def test_short_thread_has_no_load_more(self):
+        self.comment(3)
+        response = self.get_post()
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'Показать ещё')
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class StreamingPagesTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="streamer",
+            password="123456"
+        )
+        self.group = Group.objects.create(title="Поток", slug="stream")
+        for index in range(12):
+            Post.objects.create(
+                text=f"Пост номер {index}", author=self.author, group=self.group
+            )
+        self.post = Post.objects.first()
+        for index in range(3):
+            Comment.objects.create(
+                post=self.post, author=self.author, text=f"Отзыв {index}"
+            )
+
+    def urls(self):
+        return [
+            reverse('index'),
+            reverse('group_posts', args=['stream']),
+            reverse('profile', args=['streamer']),
+            reverse('post', args=['streamer', self.post.id]),
+        ]
+
+    def test_streamed_pages_match_buffered_ones(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                buffered = self.client.get(url)
+                with override_settings(STREAMING_PAGES=True):
+                    streamed = self.client.get(url)
+                self.assertFalse(buffered.streaming)
+                self.assertTrue(streamed.streaming)
+                self.assertIsNotNone(streamed.context)
+                self.assertEqual(
+                    b''.join(streamed.streaming_content).decode(),
+                    buffered.content.decode()
+                )
+
+    def test_head_and_author_card_come_first(self):
+        with override_settings(STREAMING_PAGES=True):
+            response = self.client.get(
+                reverse('post', args=['streamer', self.post.id])
+            )
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertIn('<head>', chunks[0])
+        self.assertIn('@streamer', chunks[0])
+        self.assertNotIn(self.post.text, chunks[0])
+        self.assertNotIn('Отзыв', chunks[0])
+        self.assertIn('Отзыв 0', ''.join(chunks[1:]))
+
+    def test_cards_are_sent_in_chunks(self):
+        with override_settings(STREAMING_PAGES=True):
+            response = self.client.get(reverse('index'))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        with_posts = [chunk for chunk in chunks if 'Пост номер' in chunk]
+        self.assertEqual(len(with_posts), 2)
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'],
+    REPLICA_STICKINESS=15,
+    CACHES=DUMMY_CACHES
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username="primary",
+            password="123456"
+        )
+        self.post = Post.objects.create(text="Реплицирован", author=self.author)
+        self.sync()
+
+    def sync(self):
+        """Реплика догоняет основную базу"""
+        call_command('sync_replicas', stdout=StringIO())
+
+    def test_reads_go_to_lagging_replica(self):
+        Post.objects.create(text="Свежий", author=self.author)
+        response = Client().get(reverse('index'))
+        self.assertContains(response, "Реплицирован")
+        self.assertNotContains(response, "Свежий")
+        self.sync()
+        self.assertContains(Client().get(reverse('index')), "Свежий")
+
+    def test_writer_reads_own_writes(self):
+        writer = Client()
+        writer.force_login(self.author)
+        self.sync()
+        url = reverse('post', args=['primary', self.post.id])
+        response = writer.post(
+            reverse('add_comment', args=['primary', self.post.id]),
+            {'text': 'Мой комментарий'}
+        )
+        self.assertEqual(response.cookies['primary']['max-age'], 15)
+        self.assertContains(writer.get(url), 'Мой комментарий')
+        self.assertNotContains(Client().get(url), 'Мой комментарий')
+        self.sync()
+        self.assertContains(Client().get(url), 'Мой комментарий')
+
+    def test_reads_without_writes_do_not_pin(self):
+        response = Client().get(reverse('index'))
+        self.assertNotIn('primary', response.cookies)
+
+
+@override_settings(CACHES=SQLITE_CACHES)
+class SQLiteTuningTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        connection.close()
+        connection.ensure_connection()
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma('cache_size'), -16000)
+
+    def test_maintenance_command(self):
+        out = StringIO()
+        call_command('sqlite_maintenance', '--analyze', stdout=out)
+        self.assertIn('default: statistics of all indexes rebuilt.', out.getvalue())
+        self.assertIn('default: done', out.getvalue())
+
+
+@override_settings(CACHES=SQLITE_CACHES)
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username="reader",
+            password="123456"
+        )
+        self.authors = [
+            User.objects.create_user(username=f"writer{index}")
+            for index in range(3)
+        ]
+        self.author = self.authors[0]
+        self.client.force_login(self.reader)
+
+    def assertCounts(self, user, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.followers_count, stats.following_count),
+            (followers, following)
+        )
+
+    def test_follow_is_idempotent(self):
+        """
+        Повторная подписка и отписка ничего не ломают и не двоят счетчики
+        """
+        Post.objects.create(text="В ленту", author=self.author)
+        authors = User.objects.filter(pk=self.author.pk)
+        self.assertEqual(follows.follow(self.reader.pk, authors), 1)
+        self.assertEqual(follows.follow(self.reader.pk, authors), 0)
+        self.assertCounts(self.author, 1, 0)
+        self.assertCounts(self.reader, 0, 1)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader).exists())
+
+        self.assertEqual(follows.unfollow(self.reader.pk, authors), 1)
+        self.assertEqual(follows.unfollow(self.reader.pk, authors), 0)
+        self.assertCounts(self.author, 0, 0)
+        self.assertCounts(self.reader, 0, 0)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+
+    def test_follow_view_is_one_statement(self):
+        """
+        Повторная подписка через view - один INSERT и никаких SELECT
+        """
+        url = reverse('profile_follow', args=[self.author.username])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if 'posts_follow' in query['sql']
+        ]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT'))
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_cannot_follow_self(self):
+        self.client.get(reverse('profile_follow', args=[self.reader.username]))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_bulk_follow(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text="Новый автор", author=self.authors[2])
+        created = follows.follow(
+            self.reader.pk,
+            User.objects.filter(pk__in=[user.pk for user in self.authors])
+        )
+        self.assertEqual(created, 2)
+        self.assertCounts(self.reader, 0, 3)
+        self.assertCounts(self.authors[2], 1, 0)
+        self.assertEqual(
+            follows.following_ids(self.reader.pk),
+            {user.pk for user in self.authors}
+        )
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post__author=self.authors[2]
+        ).exists())
+
+    def test_following_ids_are_cached(self):
+        """
+        Проверка "подписан ли я" не стоит запросов, пока подписки не менялись
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(follows.following_ids(self.reader.pk), {self.author.pk})
+        with self.assertNumQueries(0):
+            self.assertTrue(follows.is_following(self.reader, self.author))
+            self.assertFalse(follows.is_following(self.reader, self.authors[1]))
+
+        self.client.get(reverse('profile_unfollow', args=[self.author.username]))
+        self.assertEqual(follows.following_ids(self.reader.pk), set())
+
+    def test_profile_shows_subscription(self):
+        self.client.get(reverse('profile_follow', args=[self.author.username]))
+        response = self.client.get(reverse('profile', args=[self.author.username]))
+        self.assertTrue(response.context['following'])
+        self.assertContains(response, 'Отписаться')
+
+    def test_import_follows(self):
+        path = os.path.join(tempfile.mkdtemp(), 'follows.jsonl')
+        with open(path, 'w', encoding='utf-8') as dump:
+            dump.write("\n".join(
+                json.dumps({"type": "follow", "user": "reader", "author": name})
+                for name in ("writer0", "writer1", "writer1", "nobody")
+            ))
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertIn('skipped 1 invalid', out.getvalue())
+        self.assertIn('2 new follow(s)', out.getvalue())
+        self.assertCounts(self.reader, 0, 2)
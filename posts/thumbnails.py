@@ -0,0 +1,214 @@
+"""
+Background generation of post card thumbnails.
+
+Uploads queue a job on a small local thread pool instead of letting the
+first page view resize the image inside the request. Jobs for the same
+source image are coalesced, and until the thumbnail exists templates show
+a placeholder (see ``posts/templatetags/post_thumbnails.py``).
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import cards
+
+logger = logging.getLogger(__name__)
+
+CARD_GEOMETRY = "960x339"
+CARD_OPTIONS = {"crop": "center", "upscale": True}
+# A source that failed to decode is not retried on every page view.
+FAILURE_TIMEOUT = 60 * 60
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def _workers():
+    return getattr(settings, "THUMBNAIL_WORKERS", 2)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_workers(),
+                thread_name_prefix="thumbnails",
+            )
+        return _executor
+
+
+def card_thumbnail_file(image):
+    """
+    Returns the ``ImageFile`` the card thumbnail of ``image`` is (or will
+    be) stored as, computing its name the same way ``get_thumbnail`` does
+    but without touching the image or the key-value store.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(CARD_OPTIONS)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, CARD_GEOMETRY, options)
+    return ImageFile(name, default.storage)
+
+
+def _failure_key(image):
+    return f"thumb:failed:{image.name}"
+
+
+def _get_many_raw(keys):
+    """
+    Bulk version of ``KVStore._get_raw``: one cache round trip and at most
+    one database query for all ``keys``, filling the cache like sorl does.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    empty = cached_db_kvstore.EMPTY_VALUE
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                "key", "value"
+            )
+        )
+        fetched = {key: stored.get(key, empty) for key in missing}
+        kvstore.cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        key: None if value == empty else value
+        for key, value in values.items()
+    }
+
+
+def prefetch(posts):
+    """
+    Looks up the card thumbnails of a whole page of posts at once and
+    remembers them on the posts, so rendering the cards does no per-image
+    key-value store lookups.
+    """
+    files = {
+        post.pk: card_thumbnail_file(post.image)
+        for post in posts if post.image
+    }
+    raw = _get_many_raw([add_prefix(f.key) for f in files.values()])
+    for post in posts:
+        if post.pk not in files:
+            continue
+        value = raw.get(add_prefix(files[post.pk].key))
+        post.prefetched_thumbnail = (
+            deserialize_image_file(value) if value else None
+        )
+
+
+def lookup(post):
+    """
+    Returns the ready card thumbnail of ``post`` or ``None``. A missing
+    thumbnail is queued for generation, so the next render finds it.
+    """
+    if not post.image:
+        return None
+    thumbnail_file = card_thumbnail_file(post.image)
+    if hasattr(post, "prefetched_thumbnail"):
+        thumbnail = post.prefetched_thumbnail
+    else:
+        thumbnail = default.kvstore.get(thumbnail_file)
+    if thumbnail is None:
+        future = schedule(post)
+        # Without workers the job already ran inline.
+        if future.done() and future.result():
+            thumbnail = default.kvstore.get(thumbnail_file)
+    # Tells cards.render_cards to cache the placeholder card only briefly.
+    post.thumbnail_placeholder = thumbnail is None
+    return thumbnail
+
+
+def generate(image, retry_failed=False):
+    """
+    Generates the card thumbnail of ``image`` in the calling thread.
+    Returns ``True`` on success.
+    """
+    if not retry_failed and cache.get(_failure_key(image)):
+        return False
+    try:
+        # A savepoint, so that a swallowed database error does not break
+        # the transaction of a request or command running this inline.
+        with transaction.atomic():
+            thumbnail = get_thumbnail(image, CARD_GEOMETRY, **CARD_OPTIONS)
+            # sorl logs sources it cannot open and returns an unstored
+            # file.
+            ready = default.kvstore.get(thumbnail) is not None
+    except DatabaseError:
+        # Transient (a locked database and the like): retried on the next
+        # render instead of being marked as failed.
+        logger.warning("Cannot store thumbnail for %s", image.name,
+                       exc_info=True)
+        return False
+    except Exception:
+        logger.exception("Cannot create thumbnail for %s", image.name)
+        ready = False
+    if not ready:
+        cache.set(_failure_key(image), True, FAILURE_TIMEOUT)
+    return ready
+
+
+def _run(image):
+    try:
+        ready = generate(image)
+    finally:
+        with _lock:
+            _, post_ids = _pending.pop(image.name)
+    try:
+        # Cards rendered with the placeholder meanwhile must be re-rendered.
+        if ready:
+            for post_id in post_ids:
+                cards.bump("post", post_id)
+        return ready
+    finally:
+        connections.close_all()
+
+
+def schedule(post):
+    """
+    Queues generation of the card thumbnail of ``post``. Requests for an
+    image that is already queued join the pending job. Returns a Future.
+    """
+    image = post.image
+    with _lock:
+        job = _pending.get(image.name)
+        if job is not None:
+            job[1].add(post.pk)
+            return job[0]
+    if not _workers():
+        future = Future()
+        future.set_result(generate(image))
+        return future
+    executor = _get_executor()
+    with _lock:
+        job = _pending.get(image.name)
+        if job is not None:
+            job[1].add(post.pk)
+            return job[0]
+        future = executor.submit(_run, image)
+        _pending[image.name] = (future, {post.pk})
+    return future
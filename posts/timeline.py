@@ -0,0 +1,130 @@
+"""
+Fan-out-on-write follow feed.
+
+Every new post is copied into the ``TimelineEntry`` inbox of each follower
+of its author, so ``follow_index`` reads one user's rows from a single
+index instead of joining Post, User and Follow on every request.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from . import bulk
+from .models import Follow, Post, TimelineEntry
+
+TIMELINE_LENGTH = getattr(settings, "TIMELINE_LENGTH", 1000)
+# Inboxes are trimmed back to TIMELINE_LENGTH on every N-th fan-out
+# rather than after each post, which keeps writes cheap for popular authors.
+TIMELINE_TRIM_EVERY = getattr(settings, "TIMELINE_TRIM_EVERY", 50)
+BATCH_SIZE = 500
+
+
+def trim(user_ids):
+    """
+    Drops everything past the newest ``TIMELINE_LENGTH`` entries of every
+    given user in one statement.
+    """
+    cutoff = TimelineEntry.objects.filter(
+        user=OuterRef("user")
+    ).order_by("-pub_date").values("pub_date")[
+        TIMELINE_LENGTH - 1:TIMELINE_LENGTH
+    ]
+    TimelineEntry.objects.filter(
+        user_id__in=list(user_ids),
+        pub_date__lt=Subquery(cutoff),
+    ).delete()
+
+
+def fan_out(post):
+    """
+    Delivers a freshly created post to the inboxes of its author's
+    followers.
+    """
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        "user_id", flat=True
+    )
+    trim_inboxes = post.pk % TIMELINE_TRIM_EVERY == 0
+    with transaction.atomic():
+        for user_ids in bulk.chunks(followers.iterator(), BATCH_SIZE):
+            TimelineEntry.objects.bulk_create(
+                [
+                    TimelineEntry(
+                        user_id=user_id, post=post, pub_date=post.pub_date
+                    )
+                    for user_id in user_ids
+                ],
+                ignore_conflicts=True,
+            )
+            if trim_inboxes:
+                trim(user_ids)
+
+
+def backfill(user_id, author_id):
+    """
+    Copies the latest posts of a newly followed author into the inbox.
+    """
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        "-pub_date"
+    ).values_list("pk", "pub_date")[:TIMELINE_LENGTH]
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        trim([user_id])
+
+
+def prune(user_id, author_id):
+    """
+    Removes the posts of an unfollowed author from the inbox.
+    """
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def _fill(user_id):
+    """
+    Copies the newest ``TIMELINE_LENGTH`` posts of everyone ``user_id``
+    follows into their empty inbox with a single INSERT ... SELECT.
+    """
+    newest = Post.objects.filter(
+        author__following__user_id=user_id
+    ).order_by("-pub_date").values_list("pk", "pub_date")[:TIMELINE_LENGTH]
+    sql, params = newest.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(TimelineEntry._meta.get_field(name).column)
+        for name in ("user", "post", "pub_date")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(TimelineEntry._meta.db_table)} ({columns}) "
+            f"SELECT %s, newest.* FROM ({sql}) newest",
+            (user_id, *params),
+        )
+
+
+def rebuild(user_ids=None):
+    """
+    Recreates inboxes from the ``Follow`` table, one statement per
+    follower. Returns the number of inboxes rebuilt.
+    """
+    followers = Follow.objects.order_by("user_id").values_list(
+        "user_id", flat=True
+    ).distinct()
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        followers = followers.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+    rebuilt = 0
+    with transaction.atomic():
+        entries.delete()
+        for user_id in list(followers):
+            _fill(user_id)
+            rebuilt += 1
+    return rebuilt
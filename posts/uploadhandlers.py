@@ -0,0 +1,57 @@
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .images import max_upload_size
+
+
+class OversizedUploadedFile(UploadedFile):
+    """
+    Stand-in for an upload that went over ``MAX_UPLOAD_SIZE``. It keeps the
+    name and the number of bytes received but no content.
+    """
+    oversized = True
+
+    def __init__(self, name, content_type, size, charset,
+                 content_type_extra=None):
+        super().__init__(
+            None, name, content_type, size, charset, content_type_extra
+        )
+
+    def open(self, mode=None):
+        return self
+
+    def read(self, *args):
+        return b""
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """
+    Counts the bytes of every uploaded file and, past ``MAX_UPLOAD_SIZE``,
+    stops handing chunks to the handlers after it. The rest of the file is
+    read off the wire and thrown away, so an oversized upload costs neither
+    memory nor disk, and the form reports it via ``OversizedUploadedFile``.
+
+    Must be listed first in ``FILE_UPLOAD_HANDLERS``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.limit = max_upload_size()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received <= self.limit:
+            return None
+        return OversizedUploadedFile(
+            self.file_name,
+            self.content_type,
+            self.received,
+            self.charset,
+            self.content_type_extra,
+        )
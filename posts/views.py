@@ -1,11 +1,52 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db.models import F
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render, reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
 
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Comment
+from . import follows, streaming, thumbnails
+from .freshness import conditional_page, viewer_scopes
 from .forms import PostForm, CommentForm
+from .paginators import CursorPaginator
+from .search import search as search_posts
+from .stats import get_stats
 
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+# Numbered pages linked from a listing; "next" on the last of them leads
+# into cursor mode.
+NUMBERED_PAGES = 5
 
+
+def paginate(request, queryset, per_page=POSTS_PER_PAGE, field="pub_date"):
+    """
+    Returns ``(page, paginator)`` for a listing.
+
+    By default this is the classic numbered ``Paginator``. When the request
+    carries a ``cursor`` parameter (even an empty one, meaning the first
+    page) the listing switches to keyset pagination on ``(field, id)``,
+    which costs one indexed ``LIMIT`` query however deep the user scrolls.
+    Numbered pages link only the first ``NUMBERED_PAGES`` pages; past them
+    "next" carries a cursor, so readers paging through the UI switch to
+    keyset pagination instead of ever deeper ``OFFSET`` queries.
+    """
+    if "cursor" in request.GET:
+        paginator = CursorPaginator(queryset, per_page, field)
+        return paginator.get_page(request.GET["cursor"]), paginator
+    paginator = Paginator(queryset, per_page)
+    page = paginator.get_page(request.GET.get("page"))
+    page.page_links = paginator.page_range[:NUMBERED_PAGES]
+    if page.has_next() and page.number >= NUMBERED_PAGES:
+        page.next_cursor = CursorPaginator(
+            queryset, per_page, field
+        ).encode_cursor("next", page[len(page) - 1])
+    return page, paginator
+
+
+@conditional_page(lambda request: ["posts"])
 def index(request):
     """ 
     The function view latest 10 posts in this blog. 
@@ -18,17 +59,16 @@ def index(request):
         (latest 11 posts)and returns an HttpResponse object with that 
         rendered text.
     """
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(
+    post_list = Post.objects.for_feed()
+    page, paginator = paginate(request, post_list)
+    return streaming.render(
         request, 
         "index.html", 
         {"page": page, "paginator": paginator}
     )
 
 
+@conditional_page(lambda request, slug: ["posts"])
 def group_posts(request, slug):
     """ 
     The function view 10 posts of requested group
@@ -43,60 +83,106 @@ def group_posts(request, slug):
         object with that rendered text.
     """
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(
+    posts = group.posts.for_feed()
+    page, paginator = paginate(request, posts)
+    return streaming.render(
         request, 
         "group.html", 
         {"page": page, "paginator": paginator, "group": group}
     )
 
 
+def search(request):
+    """
+    Full-text search over posts, best matches first, paginated by cursor.
+    """
+    query = request.GET.get("q", "").strip()
+    page = search_posts(query, request.GET.get("cursor"), POSTS_PER_PAGE)
+    return render(
+        request,
+        "search.html",
+        {
+            "query": query,
+            "page": page,
+            "cursor_prefix": urlencode({"q": query}) + "&",
+        }
+    )
+
+
+def search_json(request):
+    """
+    JSON flavour of ``search`` for API clients.
+    """
+    query = request.GET.get("q", "").strip()
+    page = search_posts(query, request.GET.get("cursor"), POSTS_PER_PAGE)
+    results = [
+        {
+            "id": post.id,
+            "text": post.text,
+            "pub_date": post.pub_date.isoformat(),
+            "author": post.author.username,
+            "group": post.group.slug if post.group else None,
+            "comment_count": post.comment_count,
+            "rank": post.search_rank,
+            "url": reverse("post", args=[post.author.username, post.id]),
+        }
+        for post in page
+    ]
+    return JsonResponse({
+        "query": query,
+        "results": results,
+        "next_cursor": page.next_cursor,
+    })
+
+
 @login_required
 def new_post(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == 'POST' and form.is_valid():   
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
         return redirect('index') 
     return render(request, 'new.html', {'form': form})
 
 
+@conditional_page(
+    lambda request, username: ["posts", "users"] + viewer_scopes(request)
+)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    following = False
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author
-    ).exists()
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    post_list = author.posts.for_feed()
+    page, paginator = paginate(request, post_list)
+    following = follows.is_following(request.user, author)
 
-    return render(
+    return streaming.render(
         request,
         'profile.html', 
         {
             'page': page, 
             'paginator': paginator, 
             'author': author,
+            'stats': get_stats(author),
             'following': following
         }
     )
 
 
 @login_required
+@conditional_page(lambda request: ["posts"] + viewer_scopes(request))
 def follow_index(request):
-    post_list = Post.objects.select_related('author').filter(
-        author__following__user=request.user
-    )
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
+    post_list = Post.objects.for_feed().filter(
+        timeline_entries__user=request.user
+    ).annotate(
+        feed_date=F('timeline_entries__pub_date')
+    ).order_by('-feed_date', '-pk')
+    page, paginator = paginate(request, post_list, field='feed_date')
+    return streaming.render(
         request, 
         "follow.html", 
         {"page": page, "paginator": paginator}
@@ -105,43 +191,90 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    subscription = Follow.objects.filter(user=request.user, author=author)
-    if request.user != author and not subscription.exists():
-        Follow.objects.create(
-            user=request.user,
-            author=author
-        )
+    # Unknown usernames follow nobody and end up on the profile's 404.
+    follows.follow(request.user.pk, User.objects.filter(username=username))
     return redirect('profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    follows.unfollow(request.user.pk, User.objects.filter(username=username))
     return redirect('profile', username=username)
  
  
+@conditional_page(
+    lambda request, username, post_id: [f"post:{post_id}", "users", "groups"]
+)
 def post_view(request, username, post_id):
+    """
+    The post with the newest COMMENTS_PER_PAGE comments; older ones are
+    loaded page by page from ``post_comments``.
+    """
     post = get_object_or_404(
-        Post.objects.select_related('author'),
+        Post.objects.for_feed().select_related('author__stats'),
         id=post_id, 
         author__username=username
     )
     form = CommentForm()
-    comments = Comment.objects.filter(post=post_id)
-    return render(
+    comments = Comment.objects.filter(post=post).select_related(
+        'author'
+    ).order_by('-created', '-pk')[:COMMENTS_PER_PAGE]
+    next_cursor = None
+    if post.comment_count > len(comments):
+        next_cursor = CursorPaginator(
+            post.comments.all(), COMMENTS_PER_PAGE, field='created'
+        ).encode_cursor('next', comments[len(comments) - 1])
+    return streaming.render(
         request,
         'post.html', 
         {
             'author': post.author, 
+            'stats': get_stats(post.author),
+            'following': follows.is_following(request.user, post.author),
             'post': post, 
             'comments': comments, 
+            'next_cursor': next_cursor,
             'form': form
         }
     )
 
 
+@conditional_page(
+    lambda request, username, post_id: [f"post:{post_id}", "users"]
+)
+def post_comments(request, username, post_id):
+    """
+    A cursor page of older comments: a fragment for the "load more" button
+    of the post page, or a page of its own without JavaScript.
+    """
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        id=post_id,
+        author__username=username
+    )
+    paginator = CursorPaginator(
+        Comment.objects.filter(post=post).select_related('author'),
+        COMMENTS_PER_PAGE,
+        field='created'
+    )
+    page = paginator.get_page(request.GET.get('cursor'))
+    template = (
+        'includes/comment_list.html' if request.is_ajax()
+        else 'post_comments.html'
+    )
+    response = render(
+        request,
+        template,
+        {
+            'post': post,
+            'comments': page,
+            'next_cursor': page.next_cursor
+        }
+    )
+    patch_vary_headers(response, ['X-Requested-With'])
+    return response
+
+
 @login_required
 def add_comment(request, username, post_id):
     post = get_object_or_404(
@@ -183,7 +316,9 @@ def post_edit(request, username, post_id):
         
     form = PostForm(request.POST or None, files=request.FILES or None, instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if post.image and 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('post', username=username, post_id=post_id)
     return render(
         request,
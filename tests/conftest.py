@@ -1,4 +1,23 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # Worker threads would race the test database teardown.
+    settings.THUMBNAIL_WORKERS = 0
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(settings, tmp_path):
+    # Keep the project's cache in BASE_DIR/cache out of the tests.
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache_backends.SQLiteCache',
+            'LOCATION': str(tmp_path / 'cache.sqlite3'),
+        }
+    }
@@ -0,0 +1,307 @@
+"""
+Cache backend shared by all worker processes on one host.
+
+Entries live in a single SQLite file in WAL mode, so readers never block
+the writer and every gunicorn worker sees the same data and the same
+invalidations. Integers are stored natively, which makes ``incr``/``decr``
+a single ``UPDATE`` so versioned keys are bumped atomically across
+processes.
+
+Usage in settings::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+NOT_EXPIRED = "(expires IS NULL OR expires > ?)"
+
+
+class SQLiteCache(BaseCache):
+    """
+    Size-bounded LRU cache with TTL on top of a WAL-mode SQLite file.
+
+    Extra ``OPTIONS`` besides Django's ``MAX_ENTRIES``/``CULL_FREQUENCY``:
+
+    * ``BUSY_TIMEOUT`` - seconds to wait for the write lock (default 5);
+    * ``ACCESS_RESOLUTION`` - reads refresh the LRU timestamp of an entry
+      at most this often, in seconds (default 60), so hot keys do not turn
+      every read into a write;
+    * ``CULL_CHECK_EVERY`` - writes between two checks of the entry count
+      (default 100).
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._access_resolution = float(options.get("ACCESS_RESOLUTION", 60))
+        self._cull_check_every = int(options.get("CULL_CHECK_EVERY", 100))
+        self._local = threading.local()
+
+    # Connection handling
+
+    @property
+    def _db(self):
+        connection = getattr(self._local, "connection", None)
+        # A forked worker must not reuse the parent's connection.
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+        return connection
+
+    def _connect(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path,
+            timeout=self._busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _write(self):
+        """
+        Context manager for a write transaction that takes the lock up
+        front, so concurrent writers queue instead of deadlocking.
+        """
+        return _Transaction(self._db)
+
+    # Serialization
+
+    def _encode(self, value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    # Django cache API
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as db:
+            db.execute(
+                f"DELETE FROM cache WHERE key = ? AND NOT {NOT_EXPIRED}",
+                (key, now),
+            )
+            added = db.execute(
+                "INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)",
+                (
+                    key, self._encode(value),
+                    self.get_backend_timeout(timeout), now,
+                ),
+            ).rowcount == 1
+        if added:
+            self._maybe_cull()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {}
+        for key in keys:
+            made_key = self.make_key(key, version=version)
+            self.validate_key(made_key)
+            made[made_key] = key
+        found = self._get_many(list(made))
+        return {made[key]: value for key, value in found.items()}
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        stale = []
+        db = self._db
+        # Stay well below SQLITE_MAX_VARIABLE_NUMBER.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = db.execute(
+                f"SELECT key, value, accessed FROM cache "
+                f"WHERE key IN ({placeholders}) AND {NOT_EXPIRED}",
+                (*chunk, now),
+            )
+            for key, value, accessed in rows:
+                found[key] = self._decode(value)
+                if now - accessed > self._access_resolution:
+                    stale.append(key)
+        if stale:
+            placeholders = ", ".join("?" * len(stale))
+            with self._write() as db:
+                db.execute(
+                    f"UPDATE cache SET accessed = ? "
+                    f"WHERE key IN ({placeholders})",
+                    (now, *stale),
+                )
+        metrics.cache_lookup(len(keys), len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, self._encode(value), expires, now))
+        if not rows:
+            return []
+        with self._write() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows
+            )
+        self._maybe_cull(len(rows))
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._write() as db:
+            return db.execute(
+                f"UPDATE cache SET expires = ? "
+                f"WHERE key = ? AND {NOT_EXPIRED}",
+                (self.get_backend_timeout(timeout), key, time.time()),
+            ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as db:
+            updated = db.execute(
+                f"UPDATE cache SET value = value + ?, accessed = ? "
+                f"WHERE key = ? AND typeof(value) = 'integer' "
+                f"AND {NOT_EXPIRED}",
+                (delta, now, key, now),
+            ).rowcount
+            if not updated:
+                raise ValueError("Key '%s' not found" % key)
+            return db.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()[0]
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._db.execute(
+            f"SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}",
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        with self._write() as db:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                db.execute(
+                    f"DELETE FROM cache WHERE key IN ({placeholders})", chunk
+                )
+
+    def clear(self):
+        with self._write() as db:
+            db.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Connections are kept open for the life of the thread; Django calls
+        # close() at the end of every request.
+        pass
+
+    # Eviction
+
+    def _maybe_cull(self, writes=1):
+        local = self._local
+        local.writes = getattr(local, "writes", 0) + writes
+        if local.writes < self._cull_check_every:
+            return
+        local.writes = 0
+        self.cull()
+
+    def cull(self):
+        """
+        Drops expired entries and, above ``MAX_ENTRIES``, the least
+        recently used ``1 / CULL_FREQUENCY`` of the cache.
+        """
+        with self._write() as db:
+            db.execute(
+                "DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?",
+                (time.time(),),
+            )
+            count = db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count <= self._max_entries:
+                return
+            if not self._cull_frequency:
+                db.execute("DELETE FROM cache")
+                return
+            excess = count - self._max_entries
+            excess += self._max_entries // self._cull_frequency
+            db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
@@ -0,0 +1,109 @@
+"""
+Read replicas with read-after-write stickiness.
+
+``ReplicaRouter`` sends the reads of a request to one of the aliases in
+``DATABASE_REPLICAS`` and every write to ``default``. Replicas lag behind
+the primary, so a user who has just written must not be sent back to a
+replica that has not seen the write yet: once a request writes, the rest
+of it reads from the primary, and ``ReplicaMiddleware`` sets a cookie that
+keeps the user's reads on the primary for ``REPLICA_STICKINESS`` seconds
+(long enough to see the redirect from ``add_comment`` to ``post``).
+
+Reads outside of requests (management commands, background threads,
+sections of a streamed page) always go to the primary: they often read
+back what they have just written.
+
+Usage in settings::
+
+    DATABASES = {'default': {...}, 'replica': {...}}
+    DATABASE_ROUTERS = ['yatube.db_routers.ReplicaRouter']
+    DATABASE_REPLICAS = ['replica']
+    MIDDLEWARE = [..., 'yatube.db_routers.ReplicaMiddleware', ...]
+
+SQLite replicas are refreshed from the primary by ``manage.py
+sync_replicas``.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = "primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_local = threading.local()
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+class RequestState:
+    __slots__ = ("replica", "pinned", "wrote")
+
+    def __init__(self, replica, pinned):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+def current():
+    return getattr(_local, "state", None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current()
+        if state is None or state.pinned or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current()
+        if state is None:
+            # No opinion: writes go to default unless they explicitly use
+            # another database (``migrate --database replica``).
+            return None
+        state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Picks the replica a request reads from, or pins it to the primary:
+    unsafe methods always are, and so is every request within
+    ``REPLICA_STICKINESS`` seconds of the user's last write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        aliases = replicas()
+        pinned = (
+            request.method not in SAFE_METHODS
+            or PIN_COOKIE in request.COOKIES
+        )
+        # One replica per request, so that its queries see one snapshot.
+        replica = random.choice(aliases) if aliases else None
+        state = _local.state = RequestState(replica, pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.state = None
+        if state.wrote and aliases:
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=settings.REPLICA_STICKINESS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,289 @@
+"""
+Per-request performance instrumentation.
+
+``ServerTimingMiddleware`` counts, for every request, the database queries
+and the time spent in them, the time spent rendering templates and card
+thumbnails, and cache hits and misses. The numbers go to the client in a
+``Server-Timing`` header and are aggregated per URL name into histograms
+that ``metrics_view`` serves in the Prometheus text format.
+
+Collecting costs a couple of ``perf_counter()`` calls per query, template
+and thumbnail and one lock per request, so it stays on in production.
+Aggregates live in the memory of each worker process: scrape the workers
+one by one (or run one worker per port) to see all of them.
+
+Usage in settings::
+
+    MIDDLEWARE = [
+        'yatube.metrics.ServerTimingMiddleware',
+        ...
+    ]
+"""
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.views.decorators.cache import never_cache
+
+DURATION_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Timings:
+    """
+    What one request spent its time on; durations are in seconds.
+    """
+    __slots__ = (
+        "queries", "db", "template", "thumbnail",
+        "cache_hits", "cache_misses", "rendering",
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.thumbnail = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rendering = False
+
+    def query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self, total):
+        return ", ".join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f"tpl;dur={self.template * 1000:.1f}",
+            f"thumb;dur={self.thumbnail * 1000:.1f}",
+            f'cache;desc="{self.cache_hits} hits {self.cache_misses} misses"',
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+
+def current():
+    """
+    Returns the ``Timings`` of the request the calling thread serves, or
+    ``None`` outside of requests (management commands, worker threads).
+    """
+    return getattr(_local, "timings", None)
+
+
+@contextmanager
+def timed(field):
+    """
+    Adds the time spent in the block to ``field`` of the current request.
+    """
+    timings = current()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            timings, field,
+            getattr(timings, field) + time.perf_counter() - started,
+        )
+
+
+def cache_lookup(requested, found):
+    """
+    Called by cache backends after reading ``requested`` keys of which
+    ``found`` were present.
+    """
+    timings = current()
+    if timings is not None:
+        timings.cache_hits += found
+        timings.cache_misses += requested - found
+
+
+def _escape(value):
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def _labels(names, values):
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in sorted(self.series.items()):
+            yield f"{self.name}{_labels(self.labels, values)} {total}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self.series = {}
+
+    def observe(self, values, value):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = (*self.labels, "le")
+        for values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            bounds = (*map(_number, self.buckets), "+Inf")
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _labels(names, (*values, bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+REQUEST_DURATION = Histogram(
+    "yatube_request_duration_seconds",
+    "Time from the first middleware until the response is returned.",
+    ("view",), DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "yatube_db_queries",
+    "Database queries per request.",
+    ("view",), QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    "yatube_db_duration_seconds",
+    "Time per request spent executing database queries.",
+    ("view",), DURATION_BUCKETS,
+)
+TEMPLATE_DURATION = Histogram(
+    "yatube_template_duration_seconds",
+    "Time per request spent rendering templates.",
+    ("view",), DURATION_BUCKETS,
+)
+THUMBNAIL_DURATION = Histogram(
+    "yatube_thumbnail_duration_seconds",
+    "Time per request spent looking up or generating card thumbnails.",
+    ("view",), DURATION_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "yatube_cache_lookups_total",
+    "Cache keys read, by whether they were found.",
+    ("view", "result"),
+)
+RESPONSES = Counter(
+    "yatube_responses_total",
+    "Responses by status code.",
+    ("view", "code"),
+)
+REGISTRY = [
+    REQUEST_DURATION, DB_QUERIES, DB_DURATION, TEMPLATE_DURATION,
+    THUMBNAIL_DURATION, CACHE_LOOKUPS, RESPONSES,
+]
+
+
+def record(view, timings, duration, status):
+    key = (view,)
+    with _lock:
+        REQUEST_DURATION.observe(key, duration)
+        DB_QUERIES.observe(key, timings.queries)
+        DB_DURATION.observe(key, timings.db)
+        TEMPLATE_DURATION.observe(key, timings.template)
+        THUMBNAIL_DURATION.observe(key, timings.thumbnail)
+        CACHE_LOOKUPS.inc((view, "hit"), timings.cache_hits)
+        CACHE_LOOKUPS.inc((view, "miss"), timings.cache_misses)
+        RESPONSES.inc((view, status))
+
+
+def reset():
+    with _lock:
+        for metric in REGISTRY:
+            metric.series.clear()
+
+
+def expose():
+    with _lock:
+        lines = [line for metric in REGISTRY for line in metric.expose()]
+    return "\n".join(lines) + "\n"
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "unmatched"
+
+
+class ServerTimingMiddleware:
+    """
+    Measures every request, adds the ``Server-Timing`` header and records
+    the numbers under the name of the matched URL pattern. Goes first in
+    ``MIDDLEWARE`` so that the total covers the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = _local.timings = Timings()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.query)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        total = time.perf_counter() - started
+        response["Server-Timing"] = timings.server_timing(total)
+        record(view_name(request), timings, total, response.status_code)
+        return response
+
+
+@never_cache
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, open to ``INTERNAL_IPS`` and staff only.
+    """
+    internal = request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+    if not internal and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(expose(), content_type=CONTENT_TYPE)
@@ -50,6 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы в Server-Timing попало время всех остальных слоёв
+    'yatube.metrics.ServerTimingMiddleware',
+    'yatube.slow_queries.SlowQueryMiddleware',
+    'yatube.db_routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,7 +68,8 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, сообщающий время рендеринга в yatube.metrics
+        'BACKEND': 'yatube.template_backends.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -89,9 +94,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # соединение живёт между запросами вместе с прагмами и кэшем страниц
+        'CONN_MAX_AGE': 600,
+    },
+    # копия основной базы только для чтения; обновляется
+    # командой manage.py sync_replicas
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 600,
+    },
+}
+
+# Прагмы каждого нового соединения с SQLite (yatube/sqlite_pragmas.py)
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -16000,  # в КиБ на соединение
+    'temp_store': 'MEMORY',
 }
 
+DATABASE_ROUTERS = ['yatube.db_routers.ReplicaRouter']
+# Базы, из которых читают GET-запросы; пустой список - всё идёт в default
+DATABASE_REPLICAS = []
+# Столько секунд после записи запросы пользователя читают из default,
+# чтобы он сразу увидел свои изменения, пока реплики отстают
+REPLICA_STICKINESS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -138,6 +170,31 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки пишутся на диск кусками; файл больше MAX_UPLOAD_SIZE
+# отбрасывается, не попадая ни в память, ни на диск
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploadhandlers.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+# Картинки постов при загрузке уменьшаются до этого размера по большей стороне
+POST_IMAGE_MAX_SIDE = 2048
+
+
+# Адреса, с которых открыта страница /metrics (кроме неё пускает staff)
+INTERNAL_IPS = [
+    "127.0.0.1",
+    "::1",
+]
+
+
+# Запросы к БД не быстрее порога (в секундах) пишутся в журнал
+# SLOW_QUERY_LOG; None - журнал выключен. Сводка: manage.py slow_queries
+SLOW_QUERY_THRESHOLD = None
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'logs', 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
 
 # Login
 
@@ -154,5 +211,27 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 # Идентификатор текущего сайта
 SITE_ID = 1
 
+# Сколько последних постов хранится в ленте подписок каждого пользователя
+TIMELINE_LENGTH = 1000
+
+
+# Общий для всех процессов-воркеров кэш на SQLite в режиме WAL
+CACHES = {
+    'default': {
+        'BACKEND': 'yatube.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
+# Число фоновых потоков, готовящих миниатюры загруженных картинок;
+# 0 - готовить миниатюры прямо в запросе
+THUMBNAIL_WORKERS = 2
+
+# Отдавать ленты и страницу поста потоком (posts/streaming.py): шапка
+# страницы уходит клиенту до рендеринга карточек и комментариев
+STREAMING_PAGES = False
 
-CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',}}
+# Время жизни закэшированной карточки поста; устаревшие карточки
+# сбрасываются раньше через версии ключей (posts/cards.py)
+POST_CARD_TIMEOUT = 60 * 60 * 24
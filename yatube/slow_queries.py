@@ -0,0 +1,187 @@
+"""
+Opt-in log of slow database queries.
+
+``SlowQueryMiddleware`` times every query a request runs. Queries that take
+at least ``SLOW_QUERY_THRESHOLD`` seconds are written to the rotating log
+``SLOW_QUERY_LOG`` as JSON lines, under the fingerprint of their SQL (the
+statement with literals and parameter lists stripped) and the URL name of
+the view that issued them. ``manage.py slow_queries`` aggregates the log
+into the top offenders per fingerprint.
+
+Usage in settings::
+
+    MIDDLEWARE = [
+        'yatube.metrics.ServerTimingMiddleware',
+        'yatube.slow_queries.SlowQueryMiddleware',
+        ...
+    ]
+    SLOW_QUERY_THRESHOLD = 0.05  # None turns the middleware off
+
+The log is appended to by every worker process; rotation is not
+coordinated between them, so give busy deployments a generous
+``SLOW_QUERY_LOG_MAX_BYTES``.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from .metrics import view_name
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER = re.compile(r"%s|\?")
+LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+SPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_loggers = {}
+
+
+def normalize(sql):
+    """
+    Reduces ``sql`` to its shape: string and number literals and query
+    parameters become ``?``, lists of them ``(...)`` and multi-row
+    ``VALUES`` a single ``(...)``, so ``IN`` lists of any length and
+    bulk inserts of any size share one fingerprint.
+    """
+    sql = STRING.sub("?", sql)
+    sql = NUMBER.sub("?", sql)
+    sql = PLACEHOLDER.sub("?", sql)
+    sql = LIST.sub("(...)", sql)
+    sql = ROWS.sub("(...)", sql)
+    return SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(sql):
+    """
+    Returns ``(fingerprint, normalized sql)``.
+    """
+    normalized = normalize(sql)
+    digest = hashlib.md5(normalized.encode()).hexdigest()[:12]
+    return digest, normalized
+
+
+def log_path():
+    return settings.SLOW_QUERY_LOG
+
+
+def _logger():
+    path = log_path()
+    max_bytes = settings.SLOW_QUERY_LOG_MAX_BYTES
+    backups = settings.SLOW_QUERY_LOG_BACKUPS
+    key = (path, max_bytes, backups)
+    with _lock:
+        logger = _loggers.get(key)
+        if logger is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups,
+                encoding="utf-8", delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.Logger(f"yatube.slow_queries:{path}")
+            logger.addHandler(handler)
+            _loggers[key] = logger
+        return logger
+
+
+def log_query(view, sql, duration, many=False):
+    digest, normalized = fingerprint(sql)
+    _logger().warning(json.dumps({
+        "time": timezone.now().isoformat(),
+        "view": view,
+        "fingerprint": digest,
+        "duration": round(duration, 6),
+        "many": many,
+        "sql": normalized,
+    }, ensure_ascii=False))
+
+
+def log_files(path=None):
+    """
+    The current log and its rotated backups, oldest first.
+    """
+    path = path or log_path()
+    backups = []
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        backups.append(f"{path}.{number}")
+        number += 1
+    files = backups[::-1]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_log(path=None):
+    for name in log_files(path):
+        with open(name, encoding="utf-8") as log:
+            for line in log:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash or a concurrent rotation.
+                    continue
+
+
+def aggregate(records):
+    """
+    Sums log records up per fingerprint: ``{fingerprint: {"sql", "count",
+    "total", "max", "views": {view: count}}}``.
+    """
+    stats = {}
+    for record in records:
+        entry = stats.get(record["fingerprint"])
+        if entry is None:
+            entry = stats[record["fingerprint"]] = {
+                "sql": record["sql"], "count": 0, "total": 0.0, "max": 0.0,
+                "views": {},
+            }
+        entry["count"] += 1
+        entry["total"] += record["duration"]
+        entry["max"] = max(entry["max"], record["duration"])
+        views = entry["views"]
+        views[record["view"]] = views.get(record["view"], 0) + 1
+    return stats
+
+
+class SlowQueryMiddleware:
+    """
+    Logs the queries of a request that reach ``SLOW_QUERY_THRESHOLD``.
+    Not used at all while the threshold is ``None``.
+    """
+
+    def __init__(self, get_response):
+        self.threshold = getattr(settings, "SLOW_QUERY_THRESHOLD", None)
+        if self.threshold is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = self.threshold
+
+        def timed(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                duration = time.perf_counter() - started
+                if duration >= threshold:
+                    log_query(view_name(request), sql, duration, many)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timed))
+            return self.get_response(request)
@@ -0,0 +1,45 @@
+"""
+Tuning of every SQLite connection Django opens.
+
+The stock backend leaves SQLite in rollback-journal mode, where a writer
+blocks every reader and concurrent workers soon see ``database is
+locked``. On ``connection_created`` the pragmas of ``SQLITE_PRAGMAS`` are
+applied in order, typically:
+
+* ``journal_mode=WAL`` - readers never block the writer and vice versa;
+* ``synchronous=NORMAL`` - in WAL mode a crash cannot corrupt the
+  database, at worst the last transactions are lost on power failure;
+* ``busy_timeout`` - wait for the write lock instead of failing at once;
+* ``mmap_size``, ``cache_size``, ``temp_store`` - read pages through the
+  OS page cache, keep more of them per connection, sort in memory;
+* ``auto_vacuum=INCREMENTAL`` - lets ``manage.py sqlite_maintenance``
+  return free pages to the OS in small steps (takes effect on new
+  databases, or after its ``--enable-incremental-vacuum``).
+
+Connections are cheap to open but lose the page cache and the pragmas
+with them, so settings also keep them open between requests through
+``CONN_MAX_AGE``.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Pragmas about the database file; meaningless for in-memory databases,
+# where changing them needs a lock other connections may hold.
+FILE_PRAGMAS = {"auto_vacuum", "journal_mode", "mmap_size"}
+
+
+def apply(connection):
+    in_memory = connection.is_in_memory_db()
+    # On the raw connection: setup is not a query of the request that
+    # happened to open the connection.
+    for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+        if in_memory and name in FILE_PRAGMAS:
+            continue
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def configure(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        apply(connection)
@@ -0,0 +1,43 @@
+"""
+Django template backend that reports render time to ``yatube.metrics``.
+
+Only the outermost render of a request is timed: templates rendered from
+inside another one (cached post cards, ``{% include %}``) are already part
+of its duration.
+
+Usage in settings::
+
+    TEMPLATES = [
+        {
+            'BACKEND': 'yatube.template_backends.DjangoTemplates',
+            ...
+        }
+    ]
+"""
+import time
+
+from django.template.backends import django
+
+from . import metrics
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        timings = metrics.current()
+        if timings is None or timings.rendering:
+            return super().render(context, request)
+        timings.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.rendering = False
+            timings.template += time.perf_counter() - started
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
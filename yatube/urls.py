@@ -5,6 +5,8 @@ from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from yatube.metrics import metrics_view
+
 
 handler404 = "posts.views.page_not_found" # noqa
 handler500 = "posts.views.server_error" # noqa
@@ -23,6 +25,8 @@ urlpatterns += [
         path('terms/', views.flatpage, {'url': '/terms/'}, name='terms'),
         path('about-author/', views.flatpage, {'url': '/about-author/'}, name='author'),
         path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='spec'),
+        path('metrics', metrics_view, name='metrics'),
+        path('api/v1/', include('posts.api_urls')),
         path('', include('posts.urls')),
 ]
 